@@ -1,15 +1,21 @@
+from threading import Event
 from lpd8.pgm_chg import Pgm_Chg
 
 class Consummer:
 
     def __init__(self):
         self._running = True
+        self._stopped = Event()
 
     def is_running(self):
         return self._running
 
+    def wait(self):
+        self._stopped.wait()
+
     def stop(self):
         self._running = False
+        self._stopped.set()
 
     def ctrl_value(self, data):
         print('CTRL : ' + str(data))
@@ -23,4 +29,4 @@ class Consummer:
     def pgm_change(self, data):
         print('PGM CHG : ' + str(data))
         if data[1] == Pgm_Chg.PGM_CHG_4:
-            self._running = False
+            self.stop()
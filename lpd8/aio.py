@@ -0,0 +1,121 @@
+import asyncio
+from collections import namedtuple
+from functools import partial
+from lpd8.loop_bridge import get_event_loop
+from lpd8.lpd8 import LPD8
+
+# A decoded LPD8 event, data is None for program change events
+Event = namedtuple('Event', ['program', 'event_type', 'object_id', 'data'])
+
+
+class EventStream:
+    """
+    Class defining an asynchronous iterator of LPD8 events
+    Events are handed over to the event loop once per batch of messages read from the device
+    """
+
+    def __init__(self, lpd8, program, event_type, object_ids, loop):
+        self._lpd8 = lpd8
+        self._queue = asyncio.Queue()
+        self._closed = False
+        self._handles = []
+        event_types = LPD8.EVENT_TYPES if event_type == LPD8.ANY else [event_type]
+        for single_type in event_types:
+            handles = lpd8.subscribe(partial(self._push, single_type), program, single_type, object_ids, loop)
+            if isinstance(handles, list):
+                self._handles.extend(handles)
+            else:
+                self._handles.append(handles)
+
+    def _push(self, event_type, data):
+        # Runs in the event loop
+        if not self._closed:
+            self._queue.put_nowait(Event(data[0], event_type, data[1], data[2] if len(data) > 2 else None))
+
+    def close(self):
+        """
+        Stops the stream, pending iterations end once already received events are consumed
+        """
+        if not self._closed:
+            self._closed = True
+            self._lpd8.remove_subscription(self._handles)
+            self._queue.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self._queue.get()
+        if event is None:
+            self._queue.put_nowait(None)
+            raise StopAsyncIteration
+        return event
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncLPD8:
+    """
+    Asyncio front-end of the LPD8 object
+    MIDI input is still read by the LPD8 thread, events are handed over to the event loop once per batch of
+    messages. Configuration methods (set_knob_limits, set_pad_mode, ...) are forwarded to the LPD8 object
+    """
+
+    def __init__(self, lpd8=None, loop=None, **kwargs):
+        """
+        :param lpd8: An existing LPD8 object, a new one is built with kwargs if None
+        :param loop: The event loop receiving events, the loop running when events are requested if None, so that
+                     the object may be built before the loop runs
+        """
+        self._lpd8 = lpd8 if lpd8 is not None else LPD8(**kwargs)
+        self._loop = loop
+
+    def _get_loop(self):
+        if self._loop is not None:
+            return self._loop
+        return get_event_loop()
+
+    def __getattr__(self, name):
+        return getattr(self._lpd8, name)
+
+    def get_lpd8(self):
+        return self._lpd8
+
+    def events(self, program=LPD8.ANY, event_type=LPD8.ANY, object_ids=LPD8.ANY):
+        """
+        Gets an asynchronous iterator of events, to be used with async for
+        :param program: The program as defined in Program class or ANY for all programs
+        :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL, PGM_CHG or a gesture event type) or ANY for all
+                           types
+        :param object_ids: A knob, pad or program change ID, a list of IDs or ANY for all objects
+        :return: An EventStream yielding Event tuples, close it to stop receiving events
+        """
+        return EventStream(self._lpd8, program, event_type, object_ids, self._get_loop())
+
+    def subscribe(self, callback_method, program, event_type, object_ids):
+        """
+        Subscribes a function or a coroutine function, called in the event loop
+        :return: A subscription handle or a list of handles, as returned by LPD8.subscribe
+        """
+        return self._lpd8.subscribe(callback_method, program, event_type, object_ids, self._get_loop())
+
+    async def pad_on(self, program, pads):
+        """
+        Lights pads on without blocking the event loop
+        :return: True if LPD8 is running, False otherwise
+        """
+        return await self._get_loop().run_in_executor(None, self._lpd8.pad_on, program, pads)
+
+    async def pad_off(self, program, pads):
+        """
+        Lights pads off without blocking the event loop
+        :return: True if LPD8 is running, False otherwise
+        """
+        return await self._get_loop().run_in_executor(None, self._lpd8.pad_off, program, pads)
+
+    async def pad_update(self):
+        return await self._get_loop().run_in_executor(None, self._lpd8.pad_update)
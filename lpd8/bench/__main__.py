@@ -0,0 +1,60 @@
+"""
+Runs the pipeline benchmark suite and prints a summary, results may be written to a JSON file and compared with
+results of a previous run
+Usage: python -m lpd8.bench [--messages N] [--no-allocations] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+from lpd8.bench.pipeline import run_suite, MESSAGES
+
+_COLUMNS = ['messages_per_second', 'latency_p50_us', 'latency_p99_us', 'latency_p999_us',
+            'transient_bytes_per_event', 'retained_bytes_per_event']
+_HEADERS = ['msgs/s', 'p50 (us)', 'p99 (us)', 'p999 (us)', 'B/event', 'kept B/event']
+
+
+def _format(value):
+    if value is None:
+        return '-'
+    return '{:.1f}'.format(value)
+
+
+def _print_results(results, baseline=None):
+    baseline_scenarios = {}
+    if baseline is not None:
+        for scenario in baseline['scenarios']:
+            baseline_scenarios[scenario['name']] = scenario
+    print('{:<28}'.format('scenario') + ''.join('{:>14}'.format(header) for header in _HEADERS))
+    for scenario in results['scenarios']:
+        print('{:<28}'.format(scenario['name']) +
+              ''.join('{:>14}'.format(_format(scenario.get(column))) for column in _COLUMNS))
+        previous = baseline_scenarios.get(scenario['name'])
+        if previous is not None:
+            ratios = []
+            for column in _COLUMNS:
+                if scenario.get(column) is None or not previous.get(column):
+                    ratios.append('-')
+                else:
+                    ratios.append('x{:.2f}'.format(scenario[column] / previous[column]))
+            print('{:<28}'.format('  vs baseline') + ''.join('{:>14}'.format(ratio) for ratio in ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m lpd8.bench', description='LPD8 input pipeline benchmarks')
+    parser.add_argument('--messages', type=int, default=MESSAGES, help='number of messages of each scenario')
+    parser.add_argument('--no-allocations', action='store_true', help='do not measure memory allocations')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='compare results with a JSON file written by a previous run')
+    args = parser.parse_args()
+
+    results = run_suite(args.messages, not args.no_allocations)
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    _print_results(results, baseline)
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+
+main()
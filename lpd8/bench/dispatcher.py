@@ -0,0 +1,72 @@
+"""
+Micro-benchmark of Dispatcher.notify, compares the indexed dispatcher with the former linear scan while the number
+of subscribers grows
+Run it with: python -m lpd8.bench.dispatcher
+"""
+from timeit import timeit
+from lpd8.dispatcher import Dispatcher
+from lpd8.event import MidiEvent
+from lpd8.subscriber import Subscriber
+from lpd8.programs import Programs
+from lpd8.knobs import Knobs
+from lpd8.lpd8 import LPD8
+from lpd8.pads import Pads
+
+SUBSCRIBERS = [1, 10, 100, 1000]
+NOTIFICATIONS = 20000
+
+
+class LinearDispatcher:
+    """
+    Former dispatcher implementation, scans every subscriber at each notification
+    """
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback_method, program, event_type, object_id):
+        self._subscribers.append(Subscriber(callback_method, program, event_type, object_id))
+
+    def notify(self, event):
+        for subscriber in self._subscribers:
+            if subscriber.match(event.program, event.event_type, event.object_id):
+                subscriber.notify(event)
+
+
+def _callback(data):
+    pass
+
+
+def _fill(dispatcher, count):
+    # Spreads subscriptions over all programs, pads and knobs, only one of them matches the notified event
+    dispatcher.subscribe(_callback, Programs.PGM_1, LPD8.CTRL, Knobs.KNOB_1)
+    for index in range(count - 1):
+        program = index % Programs.PGM_MAX + 1
+        pad = Pads.ALL_PADS[index // Programs.PGM_MAX % Pads.PAD_MAX]
+        dispatcher.subscribe(_callback, program, LPD8.NOTE_ON, pad)
+
+
+def measure(dispatcher_class, count, notifications=NOTIFICATIONS):
+    """
+    Measures the cost of a notification
+    :param dispatcher_class: The dispatcher class to measure
+    :param count: The number of subscribers
+    :param notifications: The number of notifications sent
+    :return: The mean cost of a notification in microseconds
+    """
+    dispatcher = dispatcher_class()
+    _fill(dispatcher, count)
+    event = MidiEvent(Programs.PGM_1, LPD8.CTRL, Knobs.KNOB_1, 64, 64)
+    duration = timeit(lambda: dispatcher.notify(event), number=notifications)
+    return 1000000 * duration / notifications
+
+
+def main():
+    print('subscribers    indexed (us)    linear (us)')
+    for count in SUBSCRIBERS:
+        print('{:>11}    {:>12.3f}    {:>11.3f}'.format(count, measure(Dispatcher, count),
+                                                        measure(LinearDispatcher, count)))
+
+
+if __name__ == '__main__':
+    main()
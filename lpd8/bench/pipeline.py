@@ -0,0 +1,197 @@
+"""
+Benchmark of the whole input pipeline: synthetic message streams are injected in a loopback transport and read by
+LPD8._read_midi, which goes through Knobs.get_value, Pads.note_on / note_off and Dispatcher.notify
+Run the full suite with: python -m lpd8.bench
+"""
+import platform
+import sys
+import tracemalloc
+from time import perf_counter, time
+from lpd8.lpd8 import LPD8
+from lpd8.programs import Programs
+from lpd8.knobs import Knobs
+from lpd8.pads import Pads
+from lpd8.pgm_chg import Pgm_Chg
+from lpd8.transport import LoopbackTransport
+
+MESSAGES = 20000
+ALLOCATION_MESSAGES = 2000
+
+
+def knob_sweep(count):
+    """
+    Sweeps all knobs of program 4 up and down, one knob after the other
+    :param count: The number of messages
+    :return: A list of MIDI messages
+    """
+    messages = []
+    status = LPD8.CTRL + Programs.PGM_4 - 1
+    while len(messages) < count:
+        for knob in Knobs.ALL_KNOBS:
+            for value in list(range(128)) + list(range(127, -1, -1)):
+                messages.append([status, knob, value])
+    return messages[:count]
+
+
+def drum_roll(count):
+    """
+    Hits all pads of program 4 in turn with changing velocities, each hit being a NOTE ON and a NOTE OFF message
+    :param count: The number of messages
+    :return: A list of MIDI messages
+    """
+    messages = []
+    note_on = LPD8.NOTE_ON + Programs.PGM_4 - 1
+    note_off = LPD8.NOTE_OFF + Programs.PGM_4 - 1
+    hit = 0
+    while len(messages) < count:
+        pad = Pads.ALL_PADS[hit % Pads.PAD_MAX]
+        messages.append([note_on, pad, hit % 127 + 1])
+        messages.append([note_off, pad, 0])
+        hit += 1
+    return messages[:count]
+
+
+def pgm_storm(count):
+    """
+    Sends program changes on all programs in turn
+    :param count: The number of messages
+    :return: A list of MIDI messages
+    """
+    messages = []
+    index = 0
+    while len(messages) < count:
+        program = index % Programs.PGM_MAX + 1
+        messages.append([LPD8.PGM_CHG + program - 1, index % Pgm_Chg.PGM_MAX])
+        index += 1
+    return messages
+
+
+class _Probe:
+    """
+    Subscriber measuring the time between the injection of a message and the call of its callback method
+    """
+
+    def __init__(self):
+        self.injected = 0
+        self.latencies = []
+
+    def callback(self, data):
+        self.latencies.append(perf_counter() - self.injected)
+
+
+def _callback(data):
+    pass
+
+
+def _build(subscribers, probe_callback, records=False):
+    # Builds a headless LPD8 object, a probe subscribed to all events and idle subscribers spread over the programs
+    # that are not benchmarked
+    transport = LoopbackTransport(capture=False)
+    lpd8 = LPD8(input_mode=LPD8.POLL, transport=transport)
+    lpd8.connect()
+    for event_type in [LPD8.NOTE_ON, LPD8.NOTE_OFF, LPD8.CTRL, LPD8.PGM_CHG]:
+        lpd8.subscribe(probe_callback, LPD8.ANY, event_type, LPD8.ANY, records=records)
+    for index in range(subscribers - 1):
+        program = index % (Programs.PGM_MAX - 1) + 1
+        knob = Knobs.ALL_KNOBS[index // (Programs.PGM_MAX - 1) % Knobs.KNOB_MAX]
+        lpd8.subscribe(_callback, program, LPD8.CTRL, knob)
+    return lpd8, transport
+
+
+def _percentile(ordered, fraction):
+    if len(ordered) == 0:
+        return None
+    return ordered[int(fraction * (len(ordered) - 1))]
+
+
+def _measure_allocations(messages, subscribers, records):
+    # Traces memory while messages are read one by one. Transient bytes are the mean peak reached while reading a
+    # message, retained bytes the mean memory still held once all messages are read. The probe does not record
+    # latencies here, so that only the pipeline is measured
+    lpd8, transport = _build(subscribers, _callback, records)
+    reset_peak = getattr(tracemalloc, 'reset_peak', None)
+    transient = 0
+    tracemalloc.start()
+    start_size = tracemalloc.get_traced_memory()[0]
+    for message in messages:
+        size = tracemalloc.get_traced_memory()[0]
+        if reset_peak is not None:
+            reset_peak()
+        transport.inject(message)
+        lpd8._read_midi()
+        transient += tracemalloc.get_traced_memory()[1] - size
+    retained = tracemalloc.get_traced_memory()[0] - start_size
+    tracemalloc.stop()
+    count = len(messages)
+    return {
+        'transient_bytes_per_event': transient / count if reset_peak is not None else None,
+        'retained_bytes_per_event': retained / count
+    }
+
+
+def run_scenario(name, messages, subscribers=1, allocations=True, records=False):
+    """
+    Runs a scenario, messages are injected and read one by one so that latency is not hidden by batching
+    :param name: The scenario name
+    :param messages: The list of MIDI messages to inject
+    :param subscribers: The number of subscribers, only the probe gets events
+    :param allocations: If True, memory allocations are measured in a second run
+    :param records: If True, the probe gets MidiEvent records instead of data lists
+    :return: A dictionary with the scenario results
+    """
+    probe = _Probe()
+    lpd8, transport = _build(subscribers, probe.callback, records)
+    inject = transport.inject
+    read_midi = lpd8._read_midi
+    start = perf_counter()
+    for message in messages:
+        probe.injected = perf_counter()
+        inject(message, probe.injected)
+        read_midi()
+    duration = perf_counter() - start
+    latencies = sorted(probe.latencies)
+    result = {
+        'name': name,
+        'messages': len(messages),
+        'subscribers': subscribers,
+        'events': len(latencies),
+        'duration': duration,
+        'messages_per_second': len(messages) / duration,
+        'latency_p50_us': None,
+        'latency_p99_us': None,
+        'latency_p999_us': None
+    }
+    if len(latencies) != 0:
+        result['latency_p50_us'] = 1000000 * _percentile(latencies, .5)
+        result['latency_p99_us'] = 1000000 * _percentile(latencies, .99)
+        result['latency_p999_us'] = 1000000 * _percentile(latencies, .999)
+    if allocations:
+        result.update(_measure_allocations(messages[:ALLOCATION_MESSAGES], subscribers, records))
+    return result
+
+
+def run_suite(messages=MESSAGES, allocations=True):
+    """
+    Runs all scenarios
+    :param messages: The number of messages of each scenario
+    :param allocations: If True, memory allocations are measured
+    :return: A dictionary with environment information and the list of scenario results
+    """
+    scenarios = [
+        ('knob_sweep', knob_sweep(messages), 1, False),
+        ('knob_sweep_records', knob_sweep(messages), 1, True),
+        ('drum_roll', drum_roll(messages), 1, False),
+        ('pgm_storm', pgm_storm(messages), 1, False),
+        ('knob_sweep_100_subscribers', knob_sweep(messages), 100, False),
+        ('knob_sweep_1000_subscribers', knob_sweep(messages), 1000, False)
+    ]
+    results = []
+    for name, scenario_messages, subscribers, records in scenarios:
+        results.append(run_scenario(name, scenario_messages, subscribers, allocations, records))
+    return {
+        'timestamp': time(),
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'scenarios': results
+    }
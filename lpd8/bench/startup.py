@@ -0,0 +1,67 @@
+"""
+Startup benchmark, measures in a fresh interpreter the time to import the lpd8 package, build an LPD8 object, start
+it and get the first event through a LoopbackTransport, and checks that building the object touches no MIDI port
+Run it with: python -m lpd8.bench.startup
+"""
+import json
+import subprocess
+import sys
+
+RUNS = 5
+
+# Code run by each child interpreter, prints its measures as JSON
+_CHILD = '''
+import json
+import sys
+from threading import Event
+from time import perf_counter
+start = perf_counter()
+from lpd8.lpd8 import LPD8
+from lpd8.transport import LoopbackTransport
+imported = perf_counter()
+transport = LoopbackTransport(capture=False)
+lpd8 = LPD8(transport=transport)
+built = perf_counter()
+rtmidi_imported = 'rtmidi' in sys.modules
+asyncio_imported = 'asyncio' in sys.modules
+received = Event()
+lpd8.subscribe(lambda data: received.set(), LPD8.ANY, LPD8.CTRL, LPD8.ANY)
+lpd8.start()
+started = perf_counter()
+transport.inject([LPD8.CTRL + lpd8.get_program() - 1, 1, 64])
+received.wait(1)
+first_event = perf_counter()
+lpd8.stop()
+print(json.dumps({
+    'import_ms': 1000 * (imported - start),
+    'build_ms': 1000 * (built - imported),
+    'start_ms': 1000 * (started - built),
+    'first_event_ms': 1000 * (first_event - started),
+    'rtmidi_imported': rtmidi_imported,
+    'asyncio_imported': asyncio_imported
+}))
+'''
+
+_COLUMNS = ['import_ms', 'build_ms', 'start_ms', 'first_event_ms']
+
+
+def measure():
+    """
+    Measures a startup in a new interpreter
+    :return: A dictionary of durations in milliseconds, and whether rtmidi and asyncio were imported once the LPD8
+             object was built
+    """
+    output = subprocess.check_output([sys.executable, '-c', _CHILD])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    results = [measure() for run in range(RUNS)]
+    print(''.join('{:>16}'.format(column) for column in _COLUMNS))
+    print(''.join('{:>16.3f}'.format(sorted(result[column] for result in results)[RUNS // 2]) for column in _COLUMNS))
+    print('rtmidi imported at construction: ' + str(any(result['rtmidi_imported'] for result in results)))
+    print('asyncio imported at construction: ' + str(any(result['asyncio_imported'] for result in results)))
+
+
+if __name__ == '__main__':
+    main()
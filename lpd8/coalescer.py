@@ -0,0 +1,69 @@
+class Coalescer:
+    """
+    Class used to fold bursts of control change messages before they reach knobs and dispatcher
+    In a batch of messages, only the latest value of each (program, control) pair is kept, at the position of the
+    last occurrence of this control in the batch, so that no message is dispatched before a message that arrived
+    earlier than its value. Other messages are never folded and keep their order
+    A folded message gets the first value of its run as a third item, so that a sticky knob checks its gap against
+    the value the run started from rather than the jump between the two ends of the run
+    """
+
+    _CTRL = 0xB0        # Control change status, channel bits masked
+    _STATUS_MASK = 0xF0
+
+    def __init__(self, window=0):
+        """
+        :param window: Time in milliseconds during which messages are gathered before being folded, 0 only folds
+                       messages already waiting when the reader wakes up
+        """
+        self._window = window / 1000
+        self._received = 0
+        self._folded = 0
+
+    def get_window(self):
+        """
+        Gets the gathering window
+        :return: The window in seconds
+        """
+        return self._window
+
+    def coalesce(self, batch):
+        """
+        Folds control change messages of a batch
+        :param batch: A list of (MIDI message, arrival time) tuples
+        :return: The folded list of (MIDI message, arrival time) tuples, folded controls being (MIDI message, arrival
+                 time, first value) tuples whose arrival time is the one of the oldest message of their run
+        """
+        self._received += len(batch)
+        if len(batch) < 2:
+            return batch
+        index = {}
+        result = []
+        folded = 0
+        for item in batch:
+            message = item[0]
+            if (message[0] & self._STATUS_MASK) == self._CTRL:
+                key = (message[0], message[1])
+                position = index.get(key)
+                if position is not None:
+                    # The run moves to its latest message
+                    first = result[position]
+                    result[position] = None
+                    item = (message, first[1], first[2] if len(first) > 2 else first[0][2])
+                    folded += 1
+                index[key] = len(result)
+            result.append(item)
+        if folded != 0:
+            result = [item for item in result if item is not None]
+            self._folded += folded
+        return result
+
+    def get_stats(self):
+        """
+        Gets folding counters
+        :return: A dictionary with the number of received messages and the number of messages folded away
+        """
+        return {
+            'received': self._received,
+            'folded': self._folded
+        }
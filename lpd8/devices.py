@@ -0,0 +1,259 @@
+from functools import partial
+from queue import Queue, Empty
+from threading import Thread, Lock
+from lpd8.lpd8 import LPD8
+from lpd8.loop_bridge import is_coroutine_function, get_event_loop
+from lpd8.metrics import get_callback_name
+from lpd8.transport import RtMidiTransport, list_ports, is_port_held, get_port_key
+from lpd8.watcher import DeviceWatcher
+
+
+class DeviceCallback:
+    """
+    Class wrapping a callback method subscribed through a DeviceManager, the device ID is inserted in front of the
+    data, so that the callback method gets [device ID, program, object ID, value]
+    """
+
+    def __init__(self, device_id, callback_method):
+        self._device_id = device_id
+        self._callback_method = callback_method
+        # Metrics and subscriber stats name the wrapped callback method
+        self.__qualname__ = get_callback_name(callback_method)
+
+    def __call__(self, data):
+        return self._callback_method([self._device_id] + data)
+
+
+class DeviceManager(Thread):
+    """
+    Class that discovers all connected LPD8 devices and serves them from a single reader thread
+    Each device gets an LPD8 object reading no message by itself: transports of all devices push messages to a
+    shared queue, and the reader processes them in batches, per device, in arrival order
+    Device IDs are numbers given in port name order at first discovery. A device plugged again keeps its ID: a port
+    named like the port of a lost device, client numbers apart, is left to the lost device which reopens it
+    """
+
+    ANY = LPD8.ANY
+
+    def __init__(self, name=LPD8.NAME, transports=None, **options):
+        """
+        :param name: The device name used to discover devices
+        :param transports: If given, a list of Transport objects used instead of discovered devices (like
+                           LoopbackTransport objects), device IDs being their position in the list starting at 1
+        :param options: Options given to each LPD8 object (program, coalesce_window, workers, metrics...)
+        """
+        Thread.__init__(self, name='lpd8-devices')
+        self._name = name
+        self._transports = transports
+        options['input_mode'] = LPD8.EXTERNAL
+        self._options = options
+        self._queue = Queue()
+        self._devices = {}          # Device ID -> LPD8 object
+        self._subscriptions = []    # Subscriptions to all devices, applied to devices found later
+        self._wrappers = {}         # Callback method -> list of (LPD8 object, DeviceCallback object)
+        self._lock = Lock()
+        self._discover_lock = Lock()    # Discovery may run in the watcher and in the caller thread at once
+        self._watcher = None
+        self._running = False
+
+    def _enqueue(self, device_id, message, arrival):
+        # Called by transports, possibly from their own thread, each time a message arrives
+        self._queue.put((device_id, message, arrival))
+
+    def _add_device(self, device_id, transport):
+        transport.set_callback(partial(self._enqueue, device_id))
+        lpd8 = LPD8(transport=transport, device_id=device_id, **self._options)
+        if not lpd8.connect():
+            transport.set_callback(None)
+            return None
+        with self._lock:
+            self._devices[device_id] = lpd8
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            self._subscribe_device(lpd8, *subscription)
+        if self._running:
+            lpd8.start()
+        return lpd8
+
+    def discover(self):
+        """
+        Looks for connected devices and builds an LPD8 object for each new one
+        :return: The list of IDs of new devices
+        """
+        with self._discover_lock:
+            return self._discover()
+
+    def _discover(self):
+        found = []
+        if self._transports is not None:
+            for index, transport in enumerate(self._transports):
+                device_id = index + 1
+                if self.get_device(device_id) is None and self._add_device(device_id, transport) is not None:
+                    found.append(device_id)
+            return found
+        port_names = list_ports(self._name, RtMidiTransport.PORTS_AGE)
+        ports = sorted((port_name, index) for index, port_name in enumerate(port_names))
+        # Port keys of lost devices, which get their ports back when they are reconnected
+        lost_keys = [lpd8.get_transport().get_port_key() for lpd8 in self.get_devices().values()
+                     if not lpd8.is_connected()]
+        for port_name, index in ports:
+            if is_port_held(port_name):
+                continue
+            port_key = get_port_key(port_name)
+            if port_key in lost_keys:
+                lost_keys.remove(port_key)
+                continue
+            with self._lock:
+                device_id = max(self._devices, default=0) + 1
+            if self._add_device(device_id, RtMidiTransport(self._name, index)) is not None:
+                found.append(device_id)
+        return found
+
+    def get_devices(self):
+        """
+        Gets served devices
+        :return: A dictionary of LPD8 objects by device ID
+        """
+        with self._lock:
+            return dict(self._devices)
+
+    def get_device(self, device_id):
+        """
+        Gets the LPD8 object of a device
+        :param device_id: The device ID
+        :return: The LPD8 object, None if the device is unknown
+        """
+        with self._lock:
+            return self._devices.get(device_id)
+
+    def _subscribe_device(self, lpd8, callback_method, program, event_type, object_ids, loop, overflow):
+        if loop is None and is_coroutine_function(callback_method):
+            loop = get_event_loop()
+        wrapper = DeviceCallback(lpd8.get_device_id(), callback_method)
+        lpd8.subscribe(wrapper, program, event_type, object_ids, loop, overflow)
+        with self._lock:
+            self._wrappers.setdefault(callback_method, []).append((lpd8, wrapper))
+
+    def subscribe(self, callback_method, device_id, program, event_type, object_ids, loop=None, overflow=None):
+        """
+        Subscribes a callback method to events of a device or of all devices. The callback method gets
+        [device ID, program, object ID, value] lists
+        :param callback_method: The callback method itself, coroutine functions run in the running asyncio event loop
+        :param device_id: The device ID, or ANY for all devices including devices found later
+        :param program: The program as defined in Program class or ANY for all programs
+        :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL or PGM_CHG)
+        :param object_ids: A knob, pad or program change ID, a list of IDs or ANY for all objects
+        :param loop: If given, the callback method runs in this asyncio event loop
+        :param overflow: Overflow policy of this subscriber when a worker pool is used, default policy if None
+        :raise KeyError: If the device is unknown
+        """
+        subscription = (callback_method, program, event_type, object_ids, loop, overflow)
+        if device_id is self.ANY:
+            with self._lock:
+                self._subscriptions.append(subscription)
+                devices = list(self._devices.values())
+        else:
+            with self._lock:
+                devices = [self._devices[device_id]]
+        for lpd8 in devices:
+            self._subscribe_device(lpd8, *subscription)
+
+    def unsubscribe_callback(self, callback_method):
+        """
+        Removes all subscriptions of a callback method on all devices
+        :param callback_method: The callback method itself
+        :return: The number of removed subscriptions
+        """
+        with self._lock:
+            self._subscriptions = [subscription for subscription in self._subscriptions
+                                   if subscription[0] != callback_method]
+            wrappers = self._wrappers.pop(callback_method, [])
+        count = 0
+        for lpd8, wrapper in wrappers:
+            count += lpd8.unsubscribe_callback(wrapper)
+        return count
+
+    def _process(self, batches):
+        for device_id, batch in batches.items():
+            lpd8 = self.get_device(device_id)
+            if lpd8 is not None:
+                lpd8.process_input(batch)
+
+    def _service_timers(self):
+        # Fires due gesture timers of all devices
+        # :return: Seconds until the next timer is due, None if no timer is pending
+        timeout = None
+        for lpd8 in self.get_devices().values():
+            device_timeout = lpd8.service_timers()
+            if device_timeout is not None and (timeout is None or device_timeout < timeout):
+                timeout = device_timeout
+        return timeout
+
+    def run(self):
+        while self._running:
+            # Waits for the next message or the next gesture timer of any device
+            try:
+                item = self._queue.get(timeout=self._service_timers())
+            except Empty:
+                continue
+            # Gathers every pending message in per device batches, keeping arrival order within each device
+            batches = {}
+            while item is not None:
+                device_id, message, arrival = item
+                batch = batches.get(device_id)
+                if batch is None:
+                    batch = []
+                    batches[device_id] = batch
+                batch.append((message, arrival))
+                try:
+                    item = self._queue.get_nowait()
+                except Empty:
+                    item = None
+            self._process(batches)
+
+    def start(self):
+        """
+        Discovers devices if not done yet and starts the reader and all devices
+        """
+        if len(self.get_devices()) == 0:
+            self.discover()
+        self._running = True
+        for lpd8 in self.get_devices().values():
+            lpd8.start()
+        Thread.start(self)
+
+    def start_watching(self, interval=DeviceWatcher.INTERVAL):
+        """
+        Starts checking in the background that devices are still connected and looking for new devices. Lost devices
+        are reconnected as soon as possible and new devices get their LPD8 object and subscriptions to all devices
+        :param interval: Milliseconds between two checks
+        """
+        self.stop_watching()
+        self._watcher = DeviceWatcher(lambda: self.get_devices().values(), self.discover, interval)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher.join()
+            self._watcher = None
+
+    def get_watcher_stats(self):
+        """
+        Gets device watcher counters, see DeviceWatcher.get_stats
+        :return: A dictionary of counters, None if devices are not watched
+        """
+        if self._watcher is None:
+            return None
+        return self._watcher.get_stats()
+
+    def stop(self):
+        self._running = False
+        self.stop_watching()
+        for lpd8 in self.get_devices().values():
+            lpd8.stop()
+        # Wakes up the reader if it is waiting for a message
+        self._queue.put(None)
+
+    def is_running(self):
+        return self._running
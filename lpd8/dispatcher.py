@@ -1,44 +1,226 @@
+from threading import Lock
 from lpd8.subscriber import Subscriber
+from lpd8.loop_bridge import LoopBridge, AsyncSubscriber, is_coroutine_function, get_event_loop
+from lpd8.worker_pool import QueuedSubscriber
 
 class Dispatcher:
     """
-    Class used to store subscribers to LPD8 events. A subscriber may be added or suppressed from the dispatcher array
-    When a specific event arrives, the notify method is used to retrieve all subscribers to this event and send them
-    a notification and associated data
+    Class used to store subscribers to LPD8 events. A subscriber may be added or suppressed from the dispatcher index
+    Subscribers are indexed by (program, event type, object ID) keys, ANY may be used as program or object ID to
+    subscribe to all programs or all objects without registering one subscriber per object
+    When a specific event arrives, the notify method gets the subscribers of the exact key and of its wildcard
+    variants from a route cache and sends them a notification and associated data, so its cost does not depend on
+    the total number of subscribers
+    Coroutine functions and callbacks bound to an asyncio event loop are notified in their loop, once per batch of
+    messages, when the dispatcher is flushed
+    If a worker pool is set, other callback methods run on the pool instead of the reader thread
     """
+
+    ANY = None
+
     def __init__(self):
-        self._subscribers = []
+        self._index = {}        # Key -> {subscriber: None}, dictionaries keep subscription order
+        self._routes = {}       # Event key -> tuple of matching subscribers, cleared at each change
+        self._callbacks = {}    # Callback method -> {subscriber: None}
+        self._lock = Lock()     # Protects index changes against a route rebuild on the reader thread
+        self._bridges = {}      # Event loop -> LoopBridge
+        self._flush_hooks = []
+        self._worker_pool = None
+        self._metrics = None
+
+    def add_flush_hook(self, hook):
+        """
+        Registers a method called without arguments on the reader thread at the end of each batch of messages
+        :param hook: The method to call
+        """
+        with self._lock:
+            self._flush_hooks = self._flush_hooks + [hook]
+
+    def remove_flush_hook(self, hook):
+        """
+        Removes a method registered with add_flush_hook
+        :param hook: The registered method
+        """
+        with self._lock:
+            self._flush_hooks = [registered for registered in self._flush_hooks if registered != hook]
+
+    def flush(self):
+        """
+        Method called by the reader at the end of each batch of messages
+        """
+        for hook in self._flush_hooks:
+            hook()
+
+    def set_worker_pool(self, worker_pool):
+        """
+        Sets the worker pool running callback methods of subscribers registered afterwards
+        :param worker_pool: A WorkerPool object, or None to run callback methods on the reader thread
+        """
+        self._worker_pool = worker_pool
+
+    def set_metrics(self, metrics):
+        """
+        Sets the Metrics object storing callback durations. When set, notify is replaced by a measuring variant, so
+        that dispatching costs nothing more when metrics are disabled
+        :param metrics: The Metrics object, None to stop measuring
+        """
+        self._metrics = metrics
+        if metrics is None:
+            self.__dict__.pop('notify', None)
+        else:
+            self.notify = self._measure_notify
+
+    def _get_bridge(self, loop):
+        bridge = self._bridges.get(loop)
+        if bridge is None:
+            bridge = LoopBridge(loop)
+            self._bridges[loop] = bridge
+            self.add_flush_hook(bridge.flush)
+        return bridge
 
-    def subscribe(self, callback_method, program, event_type, object_id):
+    def subscribe(self, callback_method, program, event_type, object_id, loop=None, overflow=None, inline=False,
+                  records=False):
         """
         Method used to subscribe to a particular event
-        :param callback_method: The callback method itself
-        :param program: The program as defined in Program class
+        :param callback_method: The callback method itself, may be a coroutine function
+        :param program: The program as defined in Program class or ANY
         :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL or PGM_CHG)
-        :param object_id: The knob, pad or program change ID
+        :param object_id: The knob, pad or program change ID or ANY
+        :param loop: If given, the callback method runs in this asyncio event loop. Coroutine functions run in the
+                     running event loop if no loop is given
+        :param overflow: Overflow policy of the subscriber queue if a worker pool is set, pool default if None
+        :param inline: If True, the callback method runs on the reader thread even if a worker pool is set, it must
+                       return quickly
+        :param records: If True, the callback method gets MidiEvent records instead of data lists
+        :return: The subscriber, to be used as a handle to remove this subscription
         """
-        self._subscribers.append(Subscriber(callback_method, program, event_type, object_id))
+        if loop is None and is_coroutine_function(callback_method):
+            loop = get_event_loop()
+        if loop is None and self._worker_pool is not None and not inline:
+            subscriber = QueuedSubscriber(self._worker_pool, callback_method, program, event_type, object_id,
+                                          overflow, records)
+        elif loop is None:
+            subscriber = Subscriber(callback_method, program, event_type, object_id, records)
+        else:
+            subscriber = AsyncSubscriber(self._get_bridge(loop), callback_method, program, event_type, object_id,
+                                         records)
+        key = subscriber.get_key()
+        with self._lock:
+            self._index.setdefault(key, {})[subscriber] = None
+            self._callbacks.setdefault(callback_method, {})[subscriber] = None
+            self._routes = {}
+        return subscriber
+
+    def remove(self, subscriber):
+        """
+        Method used to remove a subscription using its handle
+        :param subscriber: The subscriber returned by subscribe
+        :return: True if the subscription existed, False otherwise
+        """
+        key = subscriber.get_key()
+        with self._lock:
+            subscribers = self._index.get(key)
+            if subscribers is None or subscriber not in subscribers:
+                return False
+            del subscribers[subscriber]
+            if len(subscribers) == 0:
+                del self._index[key]
+            self._routes = {}
+            callback_method = subscriber.get_callback()
+            subscribers = self._callbacks[callback_method]
+            del subscribers[subscriber]
+            if len(subscribers) == 0:
+                del self._callbacks[callback_method]
+        return True
 
     def unsubscribe(self, program, event_type, object_id):
         """
-        Method used to unsubscribe to a particular event
-        :param program: The program as defined in Program class
+        Method used to unsubscribe to a particular event, removes the oldest subscription registered with this key
+        :param program: The program as defined in Program class or ANY
         :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL or PGM_CHG)
-        :param object_id: The knob, pad or program change ID
+        :param object_id: The knob, pad or program change ID or ANY
         """
-        for subscriber in self._subscribers:
-            if subscriber.match(program, event_type, object_id):
-                self._subscribers.remove(subscriber)
-                break
+        with self._lock:
+            subscribers = self._index.get((program, event_type, object_id))
+            if subscribers is None:
+                return
+            subscriber = next(iter(subscribers))
+        self.remove(subscriber)
+
+    def unsubscribe_callback(self, callback_method):
+        """
+        Method used to remove all subscriptions of a callback method
+        :param callback_method: The callback method itself
+        :return: The number of removed subscriptions
+        """
+        with self._lock:
+            subscribers = list(self._callbacks.get(callback_method, ()))
+        for subscriber in subscribers:
+            self.remove(subscriber)
+        return len(subscribers)
+
+    def _build_route(self, key):
+        # Gathers subscribers of an event key and of its wildcard variants in a tuple, so that callbacks may safely
+        # (un)subscribe during a notification. Keys without subscribers are cached as empty tuples
+        program, event_type, object_id = key
+        route = []
+        with self._lock:
+            for index_key in (key, (self.ANY, event_type, object_id), (program, event_type, self.ANY),
+                              (self.ANY, event_type, self.ANY)):
+                route.extend(self._index.get(index_key, ()))
+            route = tuple(route)
+            self._routes[key] = route
+        return route
 
-    def notify(self, program, event_type, object_id, data=None):
+    def notify(self, event):
         """
         Method used to trigger a notification to a specific event if a subscriber exists for this event
-        :param program: The program as defined in Program class
-        :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL or PGM_CHG)
-        :param object_id: The knob, pad or program change ID
-        :param data: The data to be sent to the subscriber
+        :param event: The MidiEvent record, giving program, event type and object ID of the event and the data sent
+                      to subscribers
+        """
+        key = (event.program, event.event_type, event.object_id)
+        route = self._routes.get(key)
+        if route is None:
+            route = self._build_route(key)
+        for subscriber in route:
+            subscriber.notify(event)
+
+    def _measure_notify(self, event):
+        # Same as notify, callback durations are stored in the Metrics object
+        key = (event.program, event.event_type, event.object_id)
+        route = self._routes.get(key)
+        if route is None:
+            route = self._build_route(key)
+        metrics = self._metrics
+        for subscriber in route:
+            subscriber.measure_notify(event, metrics)
+
+    def get_subscriber_stats(self):
+        """
+        Gets queue counters of subscribers running on the worker pool
+        :return: A list of dictionaries with subscriber key, callback name, queue depth and delivered, dropped,
+                 merged and failed notification counts. Subscriptions of the same callback method share their queue
+                 and its counters
+        """
+        with self._lock:
+            subscribers = [subscriber for subscribers in self._index.values() for subscriber in subscribers]
+        stats = []
+        for subscriber in subscribers:
+            if isinstance(subscriber, QueuedSubscriber):
+                program, event_type, object_id = subscriber.get_key()
+                subscriber_stats = {
+                    'callback': getattr(subscriber.get_callback(), '__qualname__', repr(subscriber.get_callback())),
+                    'program': program,
+                    'event_type': event_type,
+                    'object_id': object_id
+                }
+                subscriber_stats.update(subscriber.get_stats())
+                stats.append(subscriber_stats)
+        return stats
+
+    def count(self):
+        """
+        Gets the number of active subscriptions
+        :return: The number of subscribers
         """
-        for subscriber in self._subscribers:
-            if subscriber.match(program, event_type, object_id):
-                subscriber.notify(program, object_id, data)
+        return sum(len(subscribers) for subscribers in self._index.values())
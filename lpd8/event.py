@@ -0,0 +1,45 @@
+class MidiEvent:
+    """
+    Class defining an event record, given to callback methods subscribed with records=True
+    The reader fills a single record per LPD8 object for every event, so callback methods running on the reader
+    thread get the same object each time and must copy it to keep it. Callback methods running on a worker pool or
+    in an event loop get their own copy
+    """
+
+    __slots__ = ('program', 'event_type', 'object_id', 'midi_value', 'value', 'arrival')
+
+    def __init__(self, program=None, event_type=None, object_id=None, midi_value=None, value=None, arrival=None):
+        """
+        :param program: The program as defined in Program class
+        :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL or PGM_CHG)
+        :param object_id: The knob, pad or program change ID
+        :param midi_value: The raw MIDI value (velocity, knob position or program change number)
+        :param value: The value computed by the knob or pad, None for program changes
+        :param arrival: The arrival time of the MIDI message, as given by time.perf_counter
+        """
+        self.program = program
+        self.event_type = event_type
+        self.object_id = object_id
+        self.midi_value = midi_value
+        self.value = value
+        self.arrival = arrival
+
+    def copy(self):
+        """
+        :return: A new record holding the same values
+        """
+        return MidiEvent(self.program, self.event_type, self.object_id, self.midi_value, self.value, self.arrival)
+
+    def to_list(self):
+        """
+        Gets the data given to list based callback methods
+        :return: A [program, object ID, value] list, [program, object ID] for program changes
+        """
+        if self.value is None:
+            return [self.program, self.object_id]
+        return [self.program, self.object_id, self.value]
+
+    def __repr__(self):
+        return ('MidiEvent(program=' + repr(self.program) + ', event_type=' + repr(self.event_type) +
+                ', object_id=' + repr(self.object_id) + ', midi_value=' + repr(self.midi_value) + ', value=' +
+                repr(self.value) + ', arrival=' + repr(self.arrival) + ')')
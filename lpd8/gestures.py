@@ -0,0 +1,101 @@
+from lpd8.pads import Pad
+
+
+class GestureEngine:
+    """
+    Class that recognizes pad gestures (long press, double tap, hold repeat) of pads having gesture modes
+    Timers are scheduled in the timer wheel of the reader, from the arrival time of MIDI messages, so that no thread
+    is started per press and gesture events are sent by the reader like any other event
+    """
+
+    LONG_PRESS = 500        # Milliseconds a pad is held before a LONG_PRESS event
+    DOUBLE_TAP = 300        # Maximum milliseconds between two hits of a DOUBLE_TAP event
+    REPEAT_DELAY = 500      # Milliseconds a pad is held before the first HOLD_REPEAT event
+    REPEAT_INTERVAL = 100   # Milliseconds between two HOLD_REPEAT events
+
+    def __init__(self, timer_wheel, notify, long_press_type, double_tap_type, hold_repeat_type):
+        """
+        :param timer_wheel: The TimerWheel of the reader
+        :param notify: The method sending an event, called with program, event type, pad, MIDI value, value and
+                       event time
+        :param long_press_type: The event type of long presses
+        :param double_tap_type: The event type of double taps
+        :param hold_repeat_type: The event type of hold repeats
+        """
+        self._timer_wheel = timer_wheel
+        self._notify = notify
+        self._long_press_type = long_press_type
+        self._double_tap_type = double_tap_type
+        self._hold_repeat_type = hold_repeat_type
+        self._long_press = self.LONG_PRESS / 1000
+        self._double_tap = self.DOUBLE_TAP / 1000
+        self._repeat_delay = self.REPEAT_DELAY / 1000
+        self._repeat_interval = self.REPEAT_INTERVAL / 1000
+        self._presses = {}      # (program, pad) -> [long press timer, hold repeat timer] of held pads
+        self._taps = {}         # (program, pad) -> arrival time of a hit waiting for a second one
+
+    def set_thresholds(self, long_press=None, double_tap=None, repeat_delay=None, repeat_interval=None):
+        """
+        Sets gesture thresholds in milliseconds, thresholds left to None are not changed
+        :param long_press: Time a pad is held before a LONG_PRESS event
+        :param double_tap: Maximum time between two hits of a DOUBLE_TAP event
+        :param repeat_delay: Time a pad is held before the first HOLD_REPEAT event
+        :param repeat_interval: Time between two HOLD_REPEAT events
+        """
+        if long_press is not None:
+            self._long_press = long_press / 1000
+        if double_tap is not None:
+            self._double_tap = double_tap / 1000
+        if repeat_delay is not None:
+            self._repeat_delay = repeat_delay / 1000
+        if repeat_interval is not None:
+            self._repeat_interval = repeat_interval / 1000
+
+    def note_on(self, program, pad, velocity, arrival, gestures):
+        """
+        Handles a pad hit, called by the reader
+        :param program: The program as defined in Program class
+        :param pad: The pad as defined in Pads class
+        :param velocity: The hit velocity
+        :param arrival: The arrival time of the message, as given by time.perf_counter
+        :param gestures: The gesture modes of the pad
+        """
+        key = (program, pad)
+        if gestures & Pad.DOUBLE_TAP_MODE:
+            tap = self._taps.pop(key, None)
+            if tap is not None and arrival - tap <= self._double_tap:
+                self._notify(program, self._double_tap_type, pad, velocity, velocity, arrival)
+            else:
+                self._taps[key] = arrival
+        # A previous press may not have been released if a NOTE OFF message was lost
+        self.note_off(program, pad)
+        if gestures & (Pad.LONG_PRESS_MODE | Pad.HOLD_REPEAT_MODE):
+            press = [None, None]
+            if gestures & Pad.LONG_PRESS_MODE:
+                press[0] = self._timer_wheel.schedule(arrival + self._long_press, self._on_long_press, program, pad,
+                                                      velocity)
+            if gestures & Pad.HOLD_REPEAT_MODE:
+                press[1] = self._timer_wheel.schedule(arrival + self._repeat_delay, self._on_hold_repeat, program,
+                                                      pad, velocity, 1, press)
+            self._presses[key] = press
+
+    def note_off(self, program, pad):
+        """
+        Handles a pad release, called by the reader
+        :param program: The program as defined in Program class
+        :param pad: The pad as defined in Pads class
+        """
+        press = self._presses.pop((program, pad), None)
+        if press is not None:
+            for timer in press:
+                if timer is not None:
+                    self._timer_wheel.cancel(timer)
+
+    def _on_long_press(self, due, program, pad, velocity):
+        self._notify(program, self._long_press_type, pad, velocity, velocity, due)
+
+    def _on_hold_repeat(self, due, program, pad, velocity, count, press):
+        # The value of a HOLD_REPEAT event is the number of repeats since the pad was hit
+        self._notify(program, self._hold_repeat_type, pad, velocity, count, due)
+        press[1] = self._timer_wheel.schedule(due + self._repeat_interval, self._on_hold_repeat, program, pad,
+                                              velocity, count + 1, press)
@@ -0,0 +1,79 @@
+from time import perf_counter
+import time
+
+# Thread CPU clock, falls back to process clock on Python versions that do not provide it
+_cpu_clock = getattr(time, 'thread_time', time.process_time)
+
+
+class InputStats:
+    """
+    Class used to measure the behaviour of the MIDI input loop
+    It accumulates wall and CPU time spent waiting for messages (idle time) and the latency between the arrival
+    of a message and the end of its dispatch to subscribers
+    All methods are meant to be called from the reader thread only
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all measures
+        """
+        self._idle_wall = 0.
+        self._idle_cpu = 0.
+        self._idle_start_wall = None
+        self._idle_start_cpu = None
+        self._batches = 0
+        self._messages = 0
+        self._latency_total = 0.
+        self._latency_max = 0.
+
+    def start_idle(self):
+        """
+        Marks the beginning of a period where the reader waits for messages
+        """
+        self._idle_start_wall = perf_counter()
+        self._idle_start_cpu = _cpu_clock()
+
+    def stop_idle(self):
+        """
+        Marks the end of a waiting period, a batch of messages has arrived
+        """
+        if self._idle_start_wall is not None:
+            self._idle_wall += perf_counter() - self._idle_start_wall
+            self._idle_cpu += _cpu_clock() - self._idle_start_cpu
+            self._idle_start_wall = None
+        self._batches += 1
+
+    def add_latency(self, latency):
+        """
+        Stores the arrival to dispatch latency of a single message
+        :param latency: The latency in seconds
+        """
+        self._messages += 1
+        self._latency_total += latency
+        if latency > self._latency_max:
+            self._latency_max = latency
+
+    def get(self):
+        """
+        Gets a summary of all measures
+        :return: A dictionary with idle CPU usage (in percent of idle wall time), batch and message counts and
+                 mean / max latencies in milliseconds
+        """
+        idle_cpu_percent = 0.
+        if self._idle_wall > 0:
+            idle_cpu_percent = round(100 * self._idle_cpu / self._idle_wall, 3)
+        latency_mean = 0.
+        if self._messages > 0:
+            latency_mean = 1000 * self._latency_total / self._messages
+        return {
+            'idle_time': round(self._idle_wall, 6),
+            'idle_cpu_time': round(self._idle_cpu, 6),
+            'idle_cpu_percent': idle_cpu_percent,
+            'batches': self._batches,
+            'messages': self._messages,
+            'latency_mean_ms': round(latency_mean, 6),
+            'latency_max_ms': round(1000 * self._latency_max, 6)
+        }
@@ -1,32 +1,41 @@
-import math
+from array import array
+from bisect import bisect_right
 from math import floor
 from lpd8.programs import Programs
 
+_TOLERANCE = 2      # Used to compute sticky effect when changing program
+_TABLE_SHIFT = 7    # Index shift of a knob response table in the flat table list
+
 class Knob:
     """
     Class that defines a single control knob
+    A knob is a light view on one entry of a Knobs array, which stores all knob properties in flat arrays. A knob
+    built on its own gets its own single entry array
+    The whole knob response is computed in a lookup table each time limits are set, so that reading a value only
+    costs an index lookup
     """
 
+    __slots__ = ('_knobs', '_program', '_knob')
+
     _MIDI_STEPS = 127   # Real number of MIDI steps
-    _TOLERANCE = 2      # Used to compute sticky effect when changing program
 
-    def __init__(self):
-        self._value = None
-        self._midi_value = None
-        self._sticky = True
-        self._sync = 0
-        self._exp_coeff = [0, 0]
-        self.set_limits()
+    # Response curves
+    LINEAR = 0          # Linear response (default)
+    EXP = 1             # Exponential response, slow increments at the beginning
+    LOG = 2             # Logarithmic response, fast increments at the beginning
+    S_CURVE = 3         # Slow increments at both ends, fast in the middle
 
-    # Adjusts value if it is an integer value or if steps are defined
-    def _adjust_value(self, value):
-        if self._inc != 0:
-            value = floor(value / self._inc) * self._inc
-        if self._is_int:
-            value = int(value)
-        else:
-            value = round(value, 2)
-        return value
+    def __init__(self, knobs=None, program=1, knob=1):
+        """
+        :param knobs: The Knobs array holding this knob, a new single knob array if None
+        :param program: The program of this knob in the Knobs array
+        :param knob: The knob ID in the Knobs array
+        """
+        if knobs is None:
+            knobs = Knobs(1, 1)
+        self._knobs = knobs
+        self._program = program
+        self._knob = knob
 
     def get_value(self, midi_value):
         """
@@ -34,24 +43,7 @@ class Knob:
         :param midi_value: The knob read midi value
         :return: The computed real value according to knob properties
         """
-        if self._sticky and not self._midi_value == None:
-            gap = self._midi_value - midi_value
-            if abs(gap) > self._TOLERANCE and self._sync == 0:
-                self._sync = gap
-            if self._sync < 0 and midi_value <= self._midi_value or self._sync > 0 and midi_value >= self._midi_value:
-                self._sync = 0
-        if self._sync == 0:
-            self._midi_value = midi_value
-            if self._is_exp:
-                value = self._exp_coeff[0] + self._exp_coeff[1] * (10 ** (midi_value / 100))
-            else:
-                value = self._min_value + (self._max_value - self._min_value) * midi_value / self._MIDI_STEPS
-            value = self._adjust_value(value)
-            if value == self._value:
-                return None
-            else:
-                self._value = value
-                return value
+        return self._knobs.get_value(self._program, self._knob, midi_value)
 
     def set_value(self, value):
         """
@@ -59,29 +51,37 @@ class Knob:
         :param value: The knob real value
         :return: True if value is between minimum and maximum range, false otherwise
         """
-        if value >= self._min_value and value <= self._max_value:
-            if self._is_exp:
-                self._midi_value = int(100 * math.log10((value - self._exp_coeff[0]) / self._exp_coeff[1]))
-            else:
-                self._midi_value = int(self._MIDI_STEPS * (value - self._min_value) / (self._max_value - self._min_value))
-            self._value = self._adjust_value(value)
-            return True
-        else:
-            return False
+        return self._knobs.set_value(self._program, self._knob, value)
+
+    def dump(self):
+        """
+        Gets all knob properties and its current value, used to save LPD8 state
+        :return: A (min value, max value, increment, is int, curve, is sticky, sync, value, MIDI value, raw table)
+                 tuple. Curve is None and raw table holds the 128 curve values for custom curves, raw table is None
+                 otherwise
+        """
+        return self._knobs.dump(self._program, self._knob)
+
+    def restore(self, dump):
+        """
+        Restores knob properties and value
+        :param dump: A tuple as returned by dump
+        """
+        self._knobs.restore(self._program, self._knob, dump)
 
     def set_sticky(self):
         """
         Sets sticky knob (memory between different programs)
         """
-        self._sticky = True
+        self._knobs.set_sticky(self._program, self._knob)
 
     def set_not_sticky(self):
         """
         Sets not sticky knob (no memory between different programs)
         """
-        self._sticky = False
+        self._knobs.set_not_sticky(self._program, self._knob)
 
-    def set_limits(self, min_value=0, max_value=_MIDI_STEPS, is_int=True, is_exp=False, steps=0):
+    def set_limits(self, min_value=0, max_value=_MIDI_STEPS, is_int=True, is_exp=False, steps=0, curve=None):
         """
         Sets knob limits and behaviour
         :param min_value: The minimum value (when MIDI value is equal to 0)
@@ -89,21 +89,20 @@ class Knob:
         :param is_int: If true, knob will only return integer values (default), otherwise float values
         :param is_exp: If true, knob values will follow an exponential curve instead of a linear one
         :param steps: Number of steps between min and max values (O to 100 with 10 steps gives 0, 10, ... increments)
+        :param curve: Response curve, overrides is_exp if given. May be LINEAR, EXP, LOG, S_CURVE, a function
+                      getting the knob position (0 to 1) and returning a level (0 to 1), or a list of
+                      (position, level) breakpoints linearly interpolated
         """
-        self._min_value = min_value
-        self._max_value = max_value
-        self._is_int = is_int
-        self._is_exp = is_exp
-        if is_exp:
-            self._exp_coeff[1] = (max_value - min_value) / (10 ** (self._MIDI_STEPS / 100) - 1)
-            self._exp_coeff[0] = min_value - self._exp_coeff[1]
-        self._inc = 0
-        if steps != 0:
-            self._inc = (max_value - min_value) / steps
+        self._knobs.set_limits(self._program, self._knob, min_value, max_value, is_int, is_exp, steps, curve)
 
 class Knobs:
     """
     Class that defines a full array of knobs (8 knobs in each program so 4 X 8 = 32 knobs in total
+    Knob properties are stored in flat typed arrays indexed by (program - 1) * knobs + knob - 1, and knob response
+    tables in a single flat list of 128 values per knob. Current values, MIDI values and sync gaps, which are read
+    and written at each event, are kept in flat lists as typed array items have to be boxed at each access
+    Each value change increments a version counter, which is stored for the changed knob and counted for its program,
+    so that readers find out what changed since a given version without comparing values
     """
 
     KNOB_1 = 1
@@ -118,24 +117,253 @@ class Knobs:
     ALL_KNOBS = [KNOB_1, KNOB_2, KNOB_3, KNOB_4, KNOB_5, KNOB_6, KNOB_7, KNOB_8]
     KNOB_MAX = len(ALL_KNOBS)
 
+    _TABLE_SIZE = Knob._MIDI_STEPS + 1
+
     def __init__(self, programs=Programs.PGM_MAX, knobs=KNOB_MAX):
-        self._knobs = []
-        for program in range(programs + 1):
-            self._knobs.append([])
-            for knob in range(knobs + 1):
-                self._knobs[program].append(Knob())
+        self._programs = programs
+        self._count = knobs
+        # Index of knob 0 of each program, so that a knob index is offsets[program] + knob
+        self._offsets = [None] + [(program - 1) * knobs - 1 for program in range(1, programs + 1)]
+        size = programs * knobs
+        self._min_values = array('d', [0.]) * size
+        self._max_values = array('d', [0.]) * size
+        self._incs = array('d', [0.]) * size
+        self._exp_coeffs = array('d', [0.]) * (2 * size)
+        self._is_int = array('B', [0]) * size
+        self._is_exp = array('B', [0]) * size
+        self._is_increasing = array('B', [0]) * size
+        self._sticky = array('B', [1]) * size
+        self._syncs = [0] * size
+        self._values = [None] * size
+        self._midi_values = [None] * size
+        self._raw_tables = array('d', [0.]) * (size * self._TABLE_SIZE)
+        self._tables = [0] * (size * self._TABLE_SIZE)
+        self._curves = [Knob.LINEAR] * size
+        self._version = 0                               # Number of value changes
+        self._versions = [0] * size                     # Version of the last value change of each knob
+        self._program_versions = [0] * (programs + 1)   # Number of value changes of each program
+        for index in range(size):
+            self._set_limits(index)
+
+    def _get_index(self, program, knob):
+        return self._offsets[program] + knob
+
+    def _changed(self, start, end):
+        # Records a value change of knobs from start to end indexes, all in the same program
+        self._version += 1
+        self._versions[start:end] = [self._version] * (end - start)
+        self._program_versions[start // self._count + 1] += 1
+
+    # Adjusts value if it is an integer value or if steps are defined
+    def _adjust_value(self, index, value):
+        inc = self._incs[index]
+        if inc != 0:
+            value = floor(value / inc) * inc
+        if self._is_int[index]:
+            value = int(value)
+        else:
+            value = round(value, 2)
+        return value
+
+    def _get_level(self, curve, position):
+        # Gets the curve level (0 to 1) for a knob position (0 to 1)
+        if curve == Knob.LOG:
+            return 1 - (10 ** (Knob._MIDI_STEPS * (1 - position) / 100) - 1) / (10 ** (Knob._MIDI_STEPS / 100) - 1)
+        elif curve == Knob.S_CURVE:
+            return position * position * (3 - 2 * position)
+        elif callable(curve):
+            return curve(position)
+        else:
+            # Breakpoints given as (position, level) pairs, linear interpolation between them
+            if position <= curve[0][0]:
+                return curve[0][1]
+            for index in range(1, len(curve)):
+                if position <= curve[index][0]:
+                    start, end = curve[index - 1], curve[index]
+                    return start[1] + (end[1] - start[1]) * (position - start[0]) / (end[0] - start[0])
+            return curve[-1][1]
+
+    def _get_raw_value(self, index, curve, midi_value):
+        # Gets the knob value for a MIDI value, before adjustment
+        min_value = self._min_values[index]
+        max_value = self._max_values[index]
+        if curve == Knob.LINEAR:
+            return min_value + (max_value - min_value) * midi_value / Knob._MIDI_STEPS
+        elif curve == Knob.EXP:
+            return self._exp_coeffs[2 * index] + self._exp_coeffs[2 * index + 1] * (10 ** (midi_value / 100))
+        else:
+            return min_value + (max_value - min_value) * self._get_level(curve, midi_value / Knob._MIDI_STEPS)
+
+    def _build_tables(self, index, curve):
+        # Computes raw and adjusted values for every MIDI value
+        self._curves[index] = curve
+        if isinstance(curve, (list, tuple)):
+            curve = sorted(curve)
+        self._set_raw_table(index, [self._get_raw_value(index, curve, midi_value)
+                                    for midi_value in range(self._TABLE_SIZE)])
+
+    def _set_raw_table(self, index, raw_table):
+        start = index * self._TABLE_SIZE
+        self._raw_tables[start:start + self._TABLE_SIZE] = array('d', raw_table)
+        self._tables[start:start + self._TABLE_SIZE] = [self._adjust_value(index, value) for value in raw_table]
+        self._is_increasing[index] = all(raw_table[position] < raw_table[position + 1]
+                                         for position in range(Knob._MIDI_STEPS))
+
+    def _set_exp_coeffs(self, index):
+        min_value = self._min_values[index]
+        coeff = (self._max_values[index] - min_value) / (10 ** (Knob._MIDI_STEPS / 100) - 1)
+        self._exp_coeffs[2 * index] = min_value - coeff
+        self._exp_coeffs[2 * index + 1] = coeff
+
+    def _set_limits(self, index, min_value=0, max_value=Knob._MIDI_STEPS, is_int=True, is_exp=False, steps=0,
+                    curve=None):
+        self._min_values[index] = min_value
+        self._max_values[index] = max_value
+        self._is_int[index] = is_int
+        if curve is None:
+            curve = Knob.EXP if is_exp else Knob.LINEAR
+        self._is_exp[index] = curve == Knob.EXP
+        if self._is_exp[index]:
+            self._set_exp_coeffs(index)
+        self._incs[index] = 0
+        if steps != 0:
+            self._incs[index] = (max_value - min_value) / steps
+        self._build_tables(index, curve)
+
+    def _get_midi_value(self, index, value):
+        # Inverse mapping, gets the highest MIDI value whose raw value does not exceed value
+        start = index * self._TABLE_SIZE
+        raw_table = self._raw_tables[start:start + self._TABLE_SIZE]
+        if self._is_increasing[index]:
+            return max(bisect_right(raw_table, value) - 1, 0)
+        else:
+            # Curve is not monotonic, nearest raw value wins
+            gaps = [abs(raw_value - value) for raw_value in raw_table]
+            return gaps.index(min(gaps))
 
-    def get_value(self, program, knob, midi_value):
+    def dump(self, program, knob):
+        """
+        Gets all properties and value of a knob, see Knob.dump
+        :param program:
+        :param knob:
+        :return: A tuple of knob properties and value
+        """
+        index = self._get_index(program, knob)
+        curve = self._curves[index]
+        if curve in (Knob.LINEAR, Knob.EXP, Knob.LOG, Knob.S_CURVE):
+            raw_table = None
+        else:
+            start = index * self._TABLE_SIZE
+            curve, raw_table = None, list(self._raw_tables[start:start + self._TABLE_SIZE])
+        return (self._min_values[index], self._max_values[index], self._incs[index], bool(self._is_int[index]),
+                curve, bool(self._sticky[index]), self._syncs[index], self._values[index], self._midi_values[index],
+                raw_table)
+
+    def restore(self, program, knob, dump):
+        """
+        Restores all properties and value of a knob, see Knob.restore
+        :param program:
+        :param knob:
+        :param dump: A tuple as returned by dump
+        :return:
+        """
+        index = self._get_index(program, knob)
+        min_value, max_value, inc, is_int, curve, sticky, sync, value, midi_value, raw_table = dump
+        self._min_values[index] = min_value
+        self._max_values[index] = max_value
+        self._incs[index] = inc
+        self._is_int[index] = is_int
+        self._is_exp[index] = curve == Knob.EXP
+        if self._is_exp[index]:
+            self._set_exp_coeffs(index)
+        if raw_table is None:
+            self._build_tables(index, curve)
+        else:
+            self._curves[index] = None
+            self._set_raw_table(index, raw_table)
+        self._sticky[index] = sticky
+        self._syncs[index] = sync
+        self._values[index] = value
+        self._midi_values[index] = midi_value
+        self._changed(index, index + 1)
+
+    def get_value(self, program, knob, midi_value, first_midi_value=None):
         """
         Get the value of a knob from a knob array
         :param program:
         :param knob:
         :param midi_value:
+        :param first_midi_value: The first MIDI value of a run of coalesced messages ending with midi_value, the jump
+                                 of a sticky knob being checked from this value. None if the message was not coalesced
         :return:
         """
-        return self._knobs[program][knob].get_value(midi_value)
+        index = self._offsets[program] + knob
+        previous_midi_value = self._midi_values[index]
+        sync = self._syncs[index]
+        if first_midi_value is None:
+            first_midi_value = midi_value
+        if sync == 0:
+            # Sticky knob gets out of sync if it jumps away from its last value (program was changed)
+            if previous_midi_value is not None and self._sticky[index]:
+                gap = previous_midi_value - first_midi_value
+                if gap > _TOLERANCE or gap < -_TOLERANCE:
+                    self._syncs[index] = sync = gap
+        if sync != 0:
+            # Knob reached its last value again, a coalesced run only has to pass it at one of its ends
+            if (sync < 0 and min(first_midi_value, midi_value) <= previous_midi_value or
+                    sync > 0 and max(first_midi_value, midi_value) >= previous_midi_value):
+                self._syncs[index] = 0
+            else:
+                return None
+        self._midi_values[index] = midi_value
+        value = self._tables[(index << _TABLE_SHIFT) + midi_value]
+        if value == self._values[index]:
+            return None
+        else:
+            self._values[index] = value
+            self._version += 1
+            self._versions[index] = self._version
+            self._program_versions[program] += 1
+            return value
 
-    def set_limits(self, program, knob, min_value, max_value, is_int=True, is_exp=False, steps=0):
+    def get_knob(self, program, knob):
+        """
+        Gets a single knob from the knob array
+        :param program:
+        :param knob:
+        :return: A Knob view on the knob array
+        """
+        return Knob(self, program, knob)
+
+    def get_current_value(self, program, knob):
+        """
+        Gets the last value of a knob, without reading a new MIDI value
+        :param program:
+        :param knob:
+        :return: The knob value, None if knob was never read or set
+        """
+        return self._values[self._get_index(program, knob)]
+
+    def get_values(self):
+        """
+        Gets last values of all knobs, without reading new MIDI values
+        :return: A list of values ordered by program then knob, None for knobs never read or set
+        """
+        return list(self._values)
+
+    def get_versions(self):
+        """
+        Gets version counters, the global counter being read first so that values read afterwards are never older
+        :return: A (version, per program versions, per knob versions) tuple, program versions being indexed by
+                 program (index 0 unused) and knob versions ordered by program then knob
+        """
+        version = self._version
+        return version, tuple(self._program_versions), tuple(self._versions)
+
+    def get_version(self):
+        return self._version
+
+    def set_limits(self, program, knob, min_value, max_value, is_int=True, is_exp=False, steps=0, curve=None):
         """
         Set knob limits and behaviour in a knob array
         :param program:
@@ -145,9 +373,10 @@ class Knobs:
         :param is_int: If true, knob will only return integer values (default), otherwise float values
         :param is_exp: If true, knob values will follow an exponential curve instead of a linear one
         :param steps: Number of steps between min and max values (O to 100 with 10 steps gives 0, 10, ... increments)
+        :param curve: Response curve (LINEAR, EXP, LOG, S_CURVE, a function or a list of breakpoints), see Knob
         :return:
         """
-        self._knobs[program][knob].set_limits(min_value, max_value, is_int, is_exp, steps)
+        self._set_limits(self._get_index(program, knob), min_value, max_value, is_int, is_exp, steps, curve)
 
     def set_value(self, program, knob, value):
         """
@@ -155,9 +384,16 @@ class Knobs:
         :param program:
         :param knob:
         :param value:
-        :return:
+        :return: True if value is between minimum and maximum range, false otherwise
         """
-        self._knobs[program][knob].set_value(value)
+        index = self._get_index(program, knob)
+        if self._min_values[index] <= value <= self._max_values[index]:
+            self._midi_values[index] = self._get_midi_value(index, value)
+            self._values[index] = self._adjust_value(index, value)
+            self._changed(index, index + 1)
+            return True
+        else:
+            return False
 
     def set_sticky(self, program, knob):
         """
@@ -166,7 +402,7 @@ class Knobs:
         :param knob:
         :return:
         """
-        self._knobs[program][knob].set_sticky()
+        self._sticky[self._get_index(program, knob)] = 1
 
     def set_not_sticky(self, program, knob):
         """
@@ -175,4 +411,23 @@ class Knobs:
         :param knob:
         :return:
         """
-        self._knobs[program][knob].set_not_sticky()
+        index = self._get_index(program, knob)
+        self._sticky[index] = 0
+        self._syncs[index] = 0
+
+    def reset(self, program=None):
+        """
+        Forgets values of all knobs of a program, limits and behaviours are kept
+        :param program: The program, all programs if None
+        :return:
+        """
+        if program is None:
+            start, end = 0, self._programs * self._count
+        else:
+            start = self._get_index(program, 1)
+            end = start + self._count
+        self._values[start:end] = [None] * (end - start)
+        self._midi_values[start:end] = [None] * (end - start)
+        self._syncs[start:end] = [0] * (end - start)
+        for program_start in range(start, end, self._count):
+            self._changed(program_start, program_start + self._count)
@@ -0,0 +1,96 @@
+from threading import Thread, Event
+from time import perf_counter
+from lpd8.pads import Pad, Pads
+
+
+class LedEngine(Thread):
+    """
+    Class that defines the thread driving pad LEDs
+    It owns blink phases of all pads and keeps a shadow copy of the LED states sent to the device, so that only
+    LEDs whose state changed are sent. It wakes up at refresh rate while some pads blink, otherwise only when
+    refresh is called
+    """
+
+    REFRESH = 20        # Milliseconds between two renderings while some pads blink
+    BLINK_PERIOD = 500  # Milliseconds between two blinks
+    BLINK = 100         # Milliseconds during which a blinking pad is lit
+
+    def __init__(self, pads, get_program, send_message, note_on, refresh=REFRESH, blink_period=BLINK_PERIOD,
+                 blink=BLINK):
+        """
+        :param pads: The Pads object holding pad states
+        :param get_program: A method returning the program to render
+        :param send_message: A method sending a MIDI message to the device
+        :param note_on: The NOTE ON status of program 1, as defined by the LPD8 object
+        :param refresh: Milliseconds between two renderings while some pads blink
+        :param blink_period: Milliseconds between two blinks
+        :param blink: Milliseconds during which a blinking pad is lit
+        """
+        Thread.__init__(self, name='lpd8-leds', daemon=True)
+        self._pads = pads
+        self._get_program = get_program
+        self._send_message = send_message
+        self._note_on = note_on
+        self._refresh = refresh / 1000
+        self._blink_period = blink_period / 1000
+        self._blink = blink / 1000
+        self._program = None
+        self._shadow = {}       # Pad -> True if lit, False if dark, missing if unknown
+        self._wake_up = Event()
+        self._running = False
+        self._epoch = perf_counter()
+
+    def set_lit(self, program, pad, lit):
+        """
+        Records a LED state change, either sent to the device or done by the device itself
+        :param program: The program as defined in Program class
+        :param pad: The pad as defined in Pads class
+        :param lit: True if the LED is lit, False otherwise
+        """
+        if program == self._program:
+            self._shadow[pad] = lit
+
+    def invalidate(self):
+        """
+        Forgets LED states, all of them are sent again at next rendering
+        """
+        self._shadow = {}
+        self._wake_up.set()
+
+    def refresh(self):
+        """
+        Requests a rendering as soon as possible
+        """
+        self._wake_up.set()
+
+    def _render(self):
+        # Sends changed LED states and tells if some pads are blinking
+        program = self._get_program()
+        if program != self._program:
+            self._program = program
+            self._shadow = {}
+        blink_lit = (perf_counter() - self._epoch) % self._blink_period < self._blink
+        blinking = False
+        shadow = self._shadow
+        for pad, state in zip(Pads.ALL_PADS, self._pads.get_frame(program)):
+            if state == Pad.BLINK:
+                blinking = True
+                lit = blink_lit
+            else:
+                lit = state == Pad.ON
+            if shadow.get(pad) != lit:
+                self._send_message([self._note_on + program - 1, pad, 1 if lit else 0])
+                shadow[pad] = lit
+        return blinking
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self._wake_up.clear()
+            timeout = self._refresh if self._render() else None
+            self._wake_up.wait(timeout)
+
+    def stop(self):
+        self._running = False
+        self._wake_up.set()
+
@@ -0,0 +1,87 @@
+from lpd8.subscriber import Subscriber
+
+_CO_COROUTINE = 0x80    # Code flag of coroutine functions, see inspect.CO_COROUTINE
+
+
+def is_coroutine_function(callback_method):
+    """
+    Tells if a callback method is a coroutine function, without importing asyncio
+    :param callback_method: A function, a method or any callable object
+    :return: True if calling it returns a coroutine
+    """
+    code = getattr(callback_method, '__code__', None)
+    return code is not None and code.co_flags & _CO_COROUTINE != 0
+
+
+def get_event_loop():
+    """
+    Gets the running asyncio event loop, asyncio is only imported when a coroutine function is subscribed
+    :return: The event loop
+    :raises RuntimeError: If no event loop is running, the loop has to be given explicitly then
+    """
+    import asyncio
+    # Python 3.6 has no get_running_loop, get_event_loop gives the running loop when called from a coroutine
+    return getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+
+
+class LoopBridge:
+    """
+    Class used to hand notifications over from the reader thread to an asyncio event loop
+    Notifications are gathered while a batch of messages is processed and the whole batch is scheduled in the loop
+    with a single call when the dispatcher is flushed
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._pending = []
+
+    def get_loop(self):
+        return self._loop
+
+    def post(self, callback_method, data):
+        """
+        Stores a notification, must be called from the reader thread
+        :param callback_method: A function or a coroutine function
+        :param data: The data sent to the callback method
+        """
+        self._pending.append((callback_method, data))
+
+    def flush(self):
+        """
+        Schedules all stored notifications in the event loop, must be called from the reader thread
+        """
+        if len(self._pending) != 0:
+            pending = self._pending
+            self._pending = []
+            try:
+                self._loop.call_soon_threadsafe(self._run, pending)
+            except RuntimeError:
+                # Event loop is closed, notifications are lost
+                pass
+
+    def _run(self, pending):
+        # Runs in the event loop, coroutines are scheduled as tasks in notification order
+        import asyncio
+        for callback_method, data in pending:
+            result = callback_method(data)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result, loop=self._loop)
+
+
+class AsyncSubscriber(Subscriber):
+    """
+    Class that defines a subscriber whose callback method runs in an asyncio event loop
+    The callback method may be a coroutine function
+    """
+
+    def __init__(self, bridge, callback_method, program, event_type, object_id, records=False):
+        Subscriber.__init__(self, callback_method, program, event_type, object_id, records)
+        self._bridge = bridge
+
+    def measure_notify(self, event, metrics):
+        # The callback method runs later in the event loop, its duration is not measured
+        self.notify(event)
+
+    def notify(self, event):
+        # The record is reused by the reader, the event loop gets a copy
+        self._bridge.post(self._callback_method, event.copy() if self._records else event.to_list())
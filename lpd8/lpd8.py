@@ -1,10 +1,25 @@
-import rtmidi
-from threading import Thread, Timer
-from time import sleep
+from queue import Queue, Empty
+from threading import Thread
+from time import sleep, perf_counter
+from lpd8.coalescer import Coalescer
 from lpd8.dispatcher import Dispatcher
+from lpd8.event import MidiEvent
+from lpd8.gestures import GestureEngine
+from lpd8.input_stats import InputStats
+from lpd8.leds import LedEngine
+from lpd8.metrics import Metrics, MetricsDumper
+from lpd8.midi_writer import MidiWriter
 from lpd8.programs import Programs
 from lpd8.knobs import Knobs
 from lpd8.pads import Pad, Pads
+from lpd8.recorder import Recorder
+from lpd8.shared_state import SharedState
+from lpd8.snapshot import Snapshot
+from lpd8.state import StateStore, Autosaver
+from lpd8.timer_wheel import TimerWheel
+from lpd8.transport import RtMidiTransport
+from lpd8.watcher import DeviceWatcher
+from lpd8.worker_pool import WorkerPool
 
 class LPD8(Thread):
     """
@@ -17,93 +32,541 @@ class LPD8(Thread):
     NOTE_OFF = 128
     CTRL = 176
     PGM_CHG = 192
+    LONG_PRESS = 256    # Gesture event types, sent by pads having gesture modes
+    DOUBLE_TAP = 257
+    HOLD_REPEAT = 258
+    EVENT_TYPES = [NOTE_ON, NOTE_OFF, CTRL, PGM_CHG, LONG_PRESS, DOUBLE_TAP, HOLD_REPEAT]
     BLINK = 100
+    ANY = Dispatcher.ANY
 
-    def __init__(self, program=4):
+    POLL = 0        # Reads MIDI input every DELAY milliseconds (legacy behaviour)
+    CALLBACK = 1    # Waits on messages pushed by the transport callback, no CPU used when idle
+    EXTERNAL = 2    # Messages are read by a DeviceManager serving several devices, no reader thread is run
+
+    QUEUE_SIZE = 256
+
+    _SYSTEM = 240   # First status byte of system messages, which have no channel
+
+    def __init__(self, program=4, input_mode=CALLBACK, coalesce_window=None, workers=0, queue_size=QUEUE_SIZE,
+                 overflow=WorkerPool.BLOCK, led_refresh=LedEngine.REFRESH, blink_period=LedEngine.BLINK_PERIOD,
+                 transport=None, metrics=False, slow_callback=Metrics.SLOW_CALLBACK, device_id=None,
+                 output_rate=MidiWriter.RATE, output_queue_size=MidiWriter.QUEUE_SIZE):
+        """
+        :param program: The program active at start, whose pads are rendered until a message of another program
+                        arrives
+        :param input_mode: POLL, CALLBACK or EXTERNAL
+        :param coalesce_window: If not None, control change bursts are folded to the latest value per control.
+                                Time in milliseconds during which messages are gathered before being folded in
+                                CALLBACK mode, 0 only folds messages already pending. In POLL mode, messages are
+                                folded per read
+        :param workers: If not 0, callback methods run on a pool of this many threads instead of the reader thread
+        :param queue_size: Maximum number of events waiting for each subscriber when a worker pool is used
+        :param overflow: What to do when a subscriber queue is full (WorkerPool.BLOCK, WorkerPool.DROP_OLDEST or
+                         WorkerPool.KEEP_LATEST which only replaces pending knob values)
+        :param led_refresh: Milliseconds between two LED renderings while some pads blink
+        :param blink_period: Milliseconds between two blinks of blinking pads
+        :param transport: The Transport object used to exchange MIDI messages, an RtMidiTransport opening the first
+                          LPD8 port if None. A LoopbackTransport runs the LPD8 object without a device
+        :param metrics: If True, message counts, latencies and callback durations are measured, see stats
+        :param slow_callback: Milliseconds above which a callback is counted as slow when metrics are enabled
+        :param device_id: The device ID given by a DeviceManager, None for a standalone LPD8 object
+        :param output_rate: Maximum messages sent to the device per second, None for no limit
+        :param output_queue_size: Maximum number of messages waiting to be sent to the device
+        """
+        Thread.__init__(self)
+        self._running = False
+        self._device_id = device_id
+        if transport is None:
+            transport = RtMidiTransport(self.NAME)
+        self._transport = transport
         self._program = program
+        self._input_mode = input_mode
+        self._coalescer = None
+        if coalesce_window is not None:
+            self._coalescer = Coalescer(coalesce_window)
+        self._queue = Queue()
+        self._input_stats = InputStats()
         self._delay = self.DELAY / 1000
-        self._blink = self.BLINK / 1000
         self._dispatcher = Dispatcher()
+        self._event = MidiEvent()
+        self._timer_wheel = TimerWheel()
+        self._gestures = GestureEngine(self._timer_wheel, self._notify, self.LONG_PRESS, self.DOUBLE_TAP,
+                                       self.HOLD_REPEAT)
+        self._worker_pool = None
+        if workers != 0:
+            self._worker_pool = WorkerPool(workers, queue_size, overflow, [self.CTRL])
+            self._dispatcher.set_worker_pool(self._worker_pool)
+        self._recorder = None
+        self._shared_state = None
+        self._router = None
+        self._watcher = None
+        self._metrics = None
+        self._metrics_dumper = None
+        if metrics:
+            self._metrics = Metrics({self.NOTE_ON: 'note_on', self.NOTE_OFF: 'note_off', self.CTRL: 'ctrl',
+                                     self.PGM_CHG: 'pgm_chg'}, slow_callback)
+            self._dispatcher.set_metrics(self._metrics)
+            if self._worker_pool is not None:
+                self._worker_pool.set_metrics(self._metrics)
+            # Measuring variants replace plain methods, so that disabled metrics cost nothing
+            self._process_batch = self._measure_batch
+            self._send_message = self._measure_send_message
         self._pads = Pads()
         self._knobs = Knobs()
-        self.connect()
-
-    def _get_midi_device(self, devices_list):
-        midi_device = None
-        midi_ports = devices_list.get_ports()
-        if len(midi_ports) != 0:
-            index = 0
-            for name in midi_ports:
-                if name.find(self.NAME) != -1:
-                    devices_list.open_port(index)
-                    midi_device = devices_list
-                index += 1
-        return midi_device
+        self._state_store = StateStore(self._knobs, self._pads)
+        self._snapshots = {}    # Program or None -> last snapshot taken, given again while nothing changes
+        self._autosaver = None
+        # Messages to the device are only written by the writer thread
+        self._writer = MidiWriter(self._send_message, output_rate, output_queue_size)
+        self._leds = LedEngine(self._pads, self.get_program, self._writer.send_led, self.NOTE_ON, led_refresh,
+                               blink_period, self.BLINK)
+
+    def _enqueue(self, message, arrival):
+        # Called by the transport, possibly from its own thread, each time a message arrives
+        self._queue.put((message, arrival))
+
+    def _notify(self, program, event_type, object_id, midi_value, value, arrival):
+        # Fills the event record, reused for every event as subscribers copy it when they keep it
+        event = self._event
+        event.program = program
+        event.event_type = event_type
+        event.object_id = object_id
+        event.midi_value = midi_value
+        event.value = value
+        event.arrival = arrival
+        self._dispatcher.notify(event)
+
+    def _process_message(self, message, arrival, first_value=None):
+        cmd = message[0]
+        ctrl = message[1]
+
+        # Each program sends on its own MIDI channel, so the channel of any message gives the active program
+        program = (cmd & 0x0F) + 1
+        if program != self._program and cmd < self._SYSTEM and program <= Programs.PGM_MAX:
+            self.set_program(program)
+
+        if cmd <= self.NOTE_OFF + Programs.PGM_MAX:
+            # Device switches pad LED off when pad is released
+            self._leds.set_lit(cmd - self.NOTE_OFF + 1, ctrl, False)
+            if self._pads.get_gestures(cmd - self.NOTE_OFF + 1, ctrl):
+                self._gestures.note_off(cmd - self.NOTE_OFF + 1, ctrl)
+            pad_value = self._pads.note_off(cmd - self.NOTE_OFF + 1, ctrl)
+            if pad_value is not None:
+                self._leds.refresh()
+                if pad_value == Pad.ON:
+                    self.pad_on(cmd - self.NOTE_OFF + 1, [ctrl])
+                self._notify(cmd - self.NOTE_OFF + 1, self.NOTE_OFF, ctrl, message[2], pad_value, arrival)
+
+        elif cmd <= self.NOTE_ON + Programs.PGM_MAX:
+            # Device switches pad LED on when pad is hit
+            self._leds.set_lit(cmd - self.NOTE_ON + 1, ctrl, True)
+            pad_value = self._pads.note_on(cmd - self.NOTE_ON + 1, ctrl, message[2])
+            if pad_value is not None:
+                self._leds.refresh()
+                self._notify(cmd - self.NOTE_ON + 1, self.NOTE_ON, ctrl, message[2], pad_value, arrival)
+            gestures = self._pads.get_gestures(cmd - self.NOTE_ON + 1, ctrl)
+            if gestures:
+                self._gestures.note_on(cmd - self.NOTE_ON + 1, ctrl, message[2], arrival, gestures)
+
+        elif cmd <= self.CTRL + Programs.PGM_MAX:
+            # Knob indexes start at 1, CC 0 would fall in the last knob of the previous program
+            if 0 < ctrl <= Knobs.KNOB_MAX:
+                knob_value = self._knobs.get_value(cmd - self.CTRL + 1, ctrl, message[2], first_value)
+                if knob_value is not None:
+                    self._notify(cmd - self.CTRL + 1, self.CTRL, ctrl, message[2], knob_value, arrival)
+
+        elif cmd <= self.PGM_CHG + Programs.PGM_MAX:
+            self._notify(cmd - self.PGM_CHG + 1, self.PGM_CHG, ctrl + 1, ctrl, None, arrival)
+
+    def _process_batch(self, batch):
+        """
+        Processes a batch of messages in arrival order
+        :param batch: A list of (MIDI message, arrival time) tuples, arrival time coming from perf_counter. Coalesced
+                      control changes have the first value of their run as third item
+        """
+        stats = self._input_stats
+        for item in batch:
+            self._process_message(*item)
+            stats.add_latency(perf_counter() - item[1])
+        self._dispatcher.flush()
+
+    def _measure_batch(self, batch):
+        # Same as _process_batch, message counts and latencies are also stored in the Metrics object
+        stats = self._input_stats
+        metrics = self._metrics
+        for item in batch:
+            metrics.count_received(item[0])
+            self._process_message(*item)
+            latency = perf_counter() - item[1]
+            stats.add_latency(latency)
+            metrics.observe_dispatch(latency)
+        self._dispatcher.flush()
+
+    def _record(self, recorder, batch):
+        # Records raw messages of a batch, before they are coalesced
+        for message, arrival in batch:
+            recorder.record(message, arrival)
+
+    def process_input(self, batch):
+        """
+        Routes, records, coalesces and processes a batch of raw messages. Called by the reader thread, or in EXTERNAL
+        mode by the thread reading messages for this object (like a DeviceManager), which must be a single thread
+        :param batch: A list of (MIDI message, arrival time) tuples, arrival time coming from perf_counter
+        """
+        router = self._router
+        if router is not None:
+            router.route_batch(batch)
+        recorder = self._recorder
+        if recorder is not None:
+            self._record(recorder, batch)
+        if self._coalescer is not None:
+            batch = self._coalescer.coalesce(batch)
+        self._process_batch(batch)
 
     def _read_midi(self):
-        msg = self._midi_in.get_message()
-        if msg is not None:
-            cmd = msg[0][0]
-            ctrl = msg[0][1]
-
-            if cmd <= self.NOTE_OFF + Programs.PGM_MAX:
-                pad_value = self._pads.note_off(cmd - self.NOTE_OFF + 1, ctrl)
-                if pad_value is not None:
-                    if pad_value == Pad.ON:
-                        self.pad_on(cmd - self.NOTE_OFF + 1, [ctrl])
-                    self._dispatcher.notify(cmd - self.NOTE_OFF + 1, self.NOTE_OFF, ctrl, pad_value)
-
-            elif cmd <= self.NOTE_ON + Programs.PGM_MAX:
-                pad_value = self._pads.note_on(cmd - self.NOTE_ON + 1, ctrl, msg[0][2])
-                if pad_value is not None:
-                    self._dispatcher.notify(cmd - self.NOTE_ON + 1, self.NOTE_ON, ctrl, pad_value)
-
-            elif cmd <= self.CTRL + Programs.PGM_MAX:
-                if ctrl <= Knobs.KNOB_MAX:
-                    knob_value = self._knobs.get_value(cmd - self.CTRL + 1, ctrl, msg[0][2])
-                    if knob_value is not None:
-                        self._dispatcher.notify(cmd - self.CTRL + 1, self.CTRL, ctrl, knob_value)
-
-            elif cmd <= self.PGM_CHG + Programs.PGM_MAX:
-                self._dispatcher.notify(cmd - self.PGM_CHG + 1, self.PGM_CHG, ctrl + 1)
+        """
+        Reads all pending messages from the MIDI input port (polling mode) and processes them
+        :return: The number of processed messages
+        """
+        batch = []
+        get_message = self._transport.get_message
+        item = get_message()
+        while item is not None:
+            batch.append(item)
+            item = get_message()
+        count = len(batch)
+        if count != 0:
+            self._input_stats.stop_idle()
+            self.process_input(batch)
+            self._input_stats.start_idle()
+        return count
 
-    def run(self):
+    def service_timers(self):
+        """
+        Fires due gesture timers, called by the reader between batches of messages. In EXTERNAL mode, it has to be
+        called by the thread calling process_input, at the latest when the returned timeout is over. Events sent by
+        timers are flushed like a batch of messages
+        :return: Seconds until the next timer is due, None if no timer is pending
+        """
+        timer_wheel = self._timer_wheel
+        if len(timer_wheel) == 0:
+            return None
+        if timer_wheel.advance(perf_counter()) != 0:
+            self._dispatcher.flush()
+        return timer_wheel.get_timeout(perf_counter())
+
+    def _run_poll(self):
         while self._running:
             self._read_midi()
+            self.service_timers()
             sleep(self._delay)
 
+    def _drain(self, batch, item):
+        # Appends item and every message already waiting in the queue to batch
+        while item is not None:
+            batch.append(item)
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                item = None
+
+    def _run_callback(self):
+        window = 0
+        if self._coalescer is not None:
+            window = self._coalescer.get_window()
+        while self._running:
+            # Waits for the next message or the next gesture timer
+            try:
+                item = self._queue.get(timeout=self.service_timers())
+            except Empty:
+                continue
+            self._input_stats.stop_idle()
+            batch = []
+            self._drain(batch, item)
+            if window > 0 and len(batch) != 0:
+                remaining = batch[0][1] + window - perf_counter()
+                while remaining > 0 and self._running:
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except Empty:
+                        break
+                    self._drain(batch, item)
+                    remaining = batch[0][1] + window - perf_counter()
+            self.process_input(batch)
+            self._input_stats.start_idle()
+
+    def run(self):
+        self._input_stats.start_idle()
+        if self._input_mode == self.CALLBACK:
+            self._run_callback()
+        elif self._input_mode == self.POLL:
+            self._run_poll()
+
+    def start(self):
+        """
+        Opens the device if not done yet and starts reading its messages
+        """
+        if not self._transport.is_open():
+            self.connect()
+        Thread.start(self)
+        if self._running:
+            self._writer.start()
+            self._leds.start()
+
     def stop(self):
         self._running = False
+        self._leds.stop()
+        self._writer.stop()
+        self.stop_autosave()
+        self.stop_metrics_dump()
+        self.stop_recording()
+        self.stop_watching()
+        self.stop_sharing()
+        if self._worker_pool is not None:
+            self._worker_pool.stop()
+        # Wakes up the reader if it is waiting for a message
+        self._queue.put(None)
 
     def is_running(self):
         return self._running
 
     def connect(self):
-        self._midi_in = self._get_midi_device(rtmidi.MidiIn())
-        self._midi_out = self._get_midi_device(rtmidi.MidiOut())
-        if self._midi_in is not None and self._midi_out is not None:
+        """
+        Opens the device, called by start if not done before. Ports are only enumerated here, so building an LPD8
+        object does not touch MIDI ports
+        :return: True if the device was found and opened, False otherwise
+        """
+        if self._input_mode == self.CALLBACK:
+            self._transport.set_callback(self._enqueue)
+        if self._transport.open():
             self._running = True
         else:
             self._running = False
             print("*** No LPD8 Controller found ***")
-        Thread.__init__(self)
+        return self._running
+
+    def is_connected(self):
+        """
+        Checks that the device is still connected, this may enumerate MIDI ports
+        :return: True if the device is connected, False otherwise
+        """
+        return self._transport.is_connected()
+
+    def reconnect(self):
+        """
+        Closes and opens MIDI ports again, knob and pad states and subscriptions are kept and all LED states are sent
+        again to the device
+        :return: True if the device was found and opened, False otherwise
+        """
+        self._transport.close()
+        if self._transport.open():
+            self._leds.invalidate()
+            return True
+        return False
+
+    def start_watching(self, interval=DeviceWatcher.INTERVAL):
+        """
+        Starts checking in the background that the device is still connected, it is reconnected as soon as possible
+        after a disconnection
+        :param interval: Milliseconds between two checks
+        """
+        self.stop_watching()
+        self._watcher = DeviceWatcher(lambda: [self], interval=interval)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher.join()
+            self._watcher = None
+
+    def get_device_id(self):
+        """
+        Gets the device ID given by a DeviceManager
+        :return: The device ID, None for a standalone LPD8 object
+        """
+        return self._device_id
+
+    def get_transport(self):
+        """
+        Gets the transport used to exchange MIDI messages
+        :return: The Transport object
+        """
+        return self._transport
+
+    def get_program(self):
+        """
+        Gets the active program, whose pads are rendered
+        :return: The program as defined in Program class
+        """
+        return self._program
+
+    def set_program(self, program):
+        """
+        Sets the active program, called by the reader when a message of another program arrives. LED states of the
+        program are sent to the device at once
+        :param program: The program as defined in Program class
+        """
+        self._program = program
+        self._leds.refresh()
+        self._publish_state()
+
+    def get_input_stats(self):
+        """
+        Gets measures taken by the MIDI input loop
+        :return: A dictionary with input mode, idle CPU usage and arrival to dispatch latency
+        """
+        stats = self._input_stats.get()
+        stats['input_mode'] = ['poll', 'callback', 'external'][self._input_mode]
+        if self._coalescer is not None:
+            stats['coalescer'] = self._coalescer.get_stats()
+        return stats
+
+    def get_writer(self):
+        """
+        Gets the writer sending messages to the device, which may be given as output to a router so that routed
+        messages do not race with LED messages. Only LED messages are merged, routed messages are all sent
+        :return: The MidiWriter object
+        """
+        return self._writer
+
+    def get_output_stats(self):
+        """
+        Gets counters of messages sent to the device
+        :return: A dictionary with queue depth and sent, merged, dropped and failed message counts
+        """
+        return self._writer.get_stats()
+
+    def stats(self):
+        """
+        Gets all runtime measures
+        :return: A dictionary with input loop stats, output stats, worker pool subscriber stats, metrics and device
+                 watcher stats, which are None if metrics are disabled or the device is not watched
+        """
+        metrics = None
+        if self._metrics is not None:
+            metrics = self._metrics.get()
+        watcher = None
+        if self._watcher is not None:
+            watcher = self._watcher.get_stats()
+        return {
+            'input': self.get_input_stats(),
+            'output': self.get_output_stats(),
+            'subscribers': self.get_subscriber_stats(),
+            'metrics': metrics,
+            'watcher': watcher
+        }
 
-    def subscribe(self, callback_method, program, event_type, object_ids):
+    def start_metrics_dump(self, path, interval=MetricsDumper.INTERVAL, output_format=Metrics.JSON):
+        """
+        Starts writing measures periodically to a file in the background
+        :param path: The file path
+        :param interval: Seconds between two writes
+        :param output_format: Metrics.JSON to write all stats, Metrics.PROMETHEUS to write metrics in Prometheus text
+                              format (node exporter textfile collector)
+        :raise ValueError: If Prometheus format is requested while metrics are disabled
+        """
+        if output_format == Metrics.PROMETHEUS:
+            if self._metrics is None:
+                raise ValueError('Metrics are disabled')
+            get_content = self._metrics.to_prometheus
+        else:
+            get_content = self._get_json_stats
+        self.stop_metrics_dump()
+        self._metrics_dumper = MetricsDumper(get_content, path, interval)
+        self._metrics_dumper.start()
+
+    def _get_json_stats(self):
+        import json
+        return json.dumps(self.stats(), indent=2, sort_keys=True) + '\n'
+
+    def stop_metrics_dump(self):
+        """
+        Stops periodic metric writes, measures are written one last time
+        """
+        if self._metrics_dumper is not None:
+            self._metrics_dumper.stop()
+            self._metrics_dumper.join()
+            self._metrics_dumper = None
+
+    def subscribe(self, callback_method, program, event_type, object_ids, loop=None, overflow=None, inline=False,
+                  records=False):
+        """
+        Subscribes a callback method to events
+        :param callback_method: The callback method itself, coroutine functions run in the running asyncio event loop
+        :param program: The program as defined in Program class or ANY for all programs
+        :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL, PGM_CHG or a gesture event type: LONG_PRESS,
+                           DOUBLE_TAP or HOLD_REPEAT)
+        :param object_ids: A knob, pad or program change ID, a list of IDs or ANY for all objects. Each object of a
+                           list gets its own subscription, so that it may be unsubscribed alone
+        :param loop: If given, the callback method runs in this asyncio event loop
+        :param overflow: Overflow policy of this subscriber when a worker pool is used, default policy if None
+        :param inline: If True, the callback method runs on the reader thread even if a worker pool is used
+        :param records: If True, the callback method gets MidiEvent records holding the raw MIDI value and arrival
+                        time, instead of [program, object ID, value] lists. Records given on the reader thread are
+                        reused, they must be copied to be kept
+        :return: A subscription handle, or a list of handles if a list of objects was given
+        """
         if isinstance(object_ids, list):
+            handles = []
             for object_id in object_ids:
-                self._dispatcher.subscribe(callback_method, program, event_type, object_id)
+                handles.append(self._dispatcher.subscribe(callback_method, program, event_type, object_id, loop,
+                                                          overflow, inline, records))
+            return handles
         else:
-            self._dispatcher.subscribe(callback_method, program, event_type, object_ids)
+            return self._dispatcher.subscribe(callback_method, program, event_type, object_ids, loop, overflow,
+                                              inline, records)
+
+    def add_flush_hook(self, hook):
+        """
+        Registers a method called without arguments on the reader thread at the end of each batch of messages, once
+        all events of the batch are dispatched
+        :param hook: The method to call
+        """
+        self._dispatcher.add_flush_hook(hook)
 
-    def unsubscribe(self, program, event_type, object_id=None):
-        self._dispatcher.unsubscribe(program, event_type, object_id)
+    def remove_flush_hook(self, hook):
+        self._dispatcher.remove_flush_hook(hook)
 
-    def set_knob_limits(self, program, knobs, min_value, max_value, is_int=True, is_exp=False, steps=0):
+    def get_subscriber_stats(self):
+        """
+        Gets queue counters of subscribers when a worker pool is used
+        :return: A list of dictionaries with queue depth and delivered, dropped, merged and failed event counts
+        """
+        return self._dispatcher.get_subscriber_stats()
+
+    def unsubscribe(self, program, event_type, object_id=ANY):
+        if isinstance(object_id, list):
+            for single_id in object_id:
+                self._dispatcher.unsubscribe(program, event_type, single_id)
+        else:
+            self._dispatcher.unsubscribe(program, event_type, object_id)
+
+    def unsubscribe_callback(self, callback_method):
+        """
+        Removes all subscriptions of a callback method
+        :param callback_method: The callback method itself
+        :return: The number of removed subscriptions
+        """
+        return self._dispatcher.unsubscribe_callback(callback_method)
+
+    def remove_subscription(self, handles):
+        """
+        Removes subscriptions using handles returned by subscribe
+        :param handles: A handle or a list of handles
+        """
+        if isinstance(handles, list):
+            for handle in handles:
+                self._dispatcher.remove(handle)
+        else:
+            self._dispatcher.remove(handles)
+
+    def set_knob_limits(self, program, knobs, min_value, max_value, is_int=True, is_exp=False, steps=0, curve=None):
         if isinstance(knobs, list):
             for knob in knobs:
-                self._knobs.set_limits(program, knob, min_value, max_value, is_int, is_exp, steps)
+                self._knobs.set_limits(program, knob, min_value, max_value, is_int, is_exp, steps, curve)
         else:
-            self._knobs.set_limits(program, knobs, min_value, max_value, is_int, is_exp, steps)
+            self._knobs.set_limits(program, knobs, min_value, max_value, is_int, is_exp, steps, curve)
 
     def set_knob_value(self, program, knobs, value):
         if isinstance(knobs, list):
@@ -111,6 +574,7 @@ class LPD8(Thread):
                 self._knobs.set_value(program, knob, value)
         else:
             self._knobs.set_value(program, knobs, value)
+        self._publish_state()
 
     def set_pad_mode(self, program, pads, mode):
         if isinstance(pads, list):
@@ -118,6 +582,17 @@ class LPD8(Thread):
                 self._pads.set_mode(program, pad, mode)
         else:
             self._pads.set_mode(program, pads, mode)
+        self._leds.refresh()
+
+    def set_gesture_thresholds(self, long_press=None, double_tap=None, repeat_delay=None, repeat_interval=None):
+        """
+        Sets gesture thresholds of pads having gesture modes, in milliseconds. Thresholds left to None are not changed
+        :param long_press: Time a pad is held before a LONG_PRESS event
+        :param double_tap: Maximum time between two hits of a DOUBLE_TAP event
+        :param repeat_delay: Time a pad is held before the first HOLD_REPEAT event
+        :param repeat_interval: Time between two HOLD_REPEAT events
+        """
+        self._gestures.set_thresholds(long_press, double_tap, repeat_delay, repeat_interval)
 
     def set_sticky_knob(self, program, knobs):
         if isinstance(knobs, list):
@@ -133,39 +608,176 @@ class LPD8(Thread):
         else:
             self._knobs.set_not_sticky(program, knobs)
 
+    def reset_knobs(self, program=None):
+        """
+        Forgets values of all knobs of a program, limits and behaviours are kept
+        :param program: The program as defined in Program class, all programs if None
+        """
+        self._knobs.reset(program)
+        self._publish_state()
+
+    def reset_pads(self, program=None):
+        """
+        Switches off all pads of a program, modes are kept
+        :param program: The program as defined in Program class, all programs if None
+        """
+        self._pads.reset(program)
+        self._leds.refresh()
+        self._publish_state()
+
     def set_pad_switch_state(self, program, pads, state):
         if isinstance(pads, list):
             for pad in pads:
                 self._pads.set_switch_state(program, pad, state)
         else:
             self._pads.set_switch_state(program, pads, state)
+        self._leds.refresh()
+        self._publish_state()
+
+    def snapshot(self, program=None):
+        """
+        Gets an immutable view of knob values and pad states, with global and per program change counters. Meant to
+        be called by frame loops: the same snapshot is returned while nothing changes, and only controls changed
+        since the previous snapshot are listed by its get_changes method
+        :param program: The program as defined in Program class, all programs if None
+        :return: A Snapshot object
+        """
+        snapshot = self._snapshots.get(program)
+        if (snapshot is not None and snapshot.get_active_program() == self._program and
+                snapshot.get_version() == self._knobs.get_version() + self._pads.get_version()):
+            return snapshot
+        snapshot = Snapshot(self._knobs, self._pads, self._program, program)
+        self._snapshots[program] = snapshot
+        return snapshot
+
+    def save_state(self, path):
+        """
+        Saves knob limits and values and pad modes and states of all programs to a binary file
+        :param path: The file path
+        """
+        self._state_store.save(path)
+
+    def load_state(self, path):
+        """
+        Restores knob limits and values and pad modes and states of all programs from a file written by save_state
+        :param path: The file path
+        :return: True if states were restored, False if the file does not exist
+        :raise ValueError: If the file is not a valid LPD8 state file
+        """
+        if self._state_store.load(path):
+            self._leds.invalidate()
+            self._publish_state()
+            return True
+        else:
+            return False
+
+    def start_autosave(self, path, interval=Autosaver.INTERVAL):
+        """
+        Starts saving states periodically in the background, states are only written when they changed
+        :param path: The file path
+        :param interval: Seconds between two saves
+        """
+        self.stop_autosave()
+        self._autosaver = Autosaver(self._state_store, path, interval)
+        self._autosaver.start()
+
+    def stop_autosave(self):
+        """
+        Stops periodic saves, states are saved one last time
+        """
+        if self._autosaver is not None:
+            self._autosaver.stop()
+            self._autosaver.join()
+            self._autosaver = None
+
+    def set_router(self, router):
+        """
+        Sets the router translating incoming messages into outgoing MIDI messages on the reader thread
+        :param router: A Router object, None to stop routing
+        """
+        self._router = router
+
+    def get_router(self):
+        return self._router
+
+    def start_recording(self, path, capacity=Recorder.CAPACITY):
+        """
+        Starts recording every raw incoming message with its arrival time to a binary log, which may be played again
+        with a Replayer object
+        :param path: The log file path, an existing file is replaced
+        :param capacity: Number of messages buffered before being written, messages are dropped if the buffer is full
+        """
+        self.stop_recording()
+        recorder = Recorder(path, capacity)
+        recorder.start()
+        self._recorder = recorder
+
+    def stop_recording(self):
+        """
+        Stops recording, pending messages are written and the log file is closed
+        :return: A dictionary with recorded, written, dropped and skipped message counts, None if not recording
+        """
+        recorder = self._recorder
+        if recorder is None:
+            return None
+        self._recorder = None
+        recorder.stop()
+        recorder.join()
+        return recorder.get_stats()
+
+    def start_sharing(self, name=None):
+        """
+        Starts publishing knob values, pad states and the active program in a shared memory block, updated at the
+        end of each batch of messages. Other processes read it with a SharedStateReader object
+        :param name: The shared memory block name, a unique name is chosen if None
+        :return: The shared memory block name
+        """
+        self.stop_sharing()
+        self._shared_state = SharedState(self._knobs, self._pads, name)
+        self._publish_state()
+        self._dispatcher.add_flush_hook(self._publish_state)
+        return self._shared_state.get_name()
+
+    def stop_sharing(self):
+        """
+        Stops publishing states and destroys the shared memory block
+        """
+        shared_state = self._shared_state
+        if shared_state is not None:
+            self._dispatcher.remove_flush_hook(self._publish_state)
+            self._shared_state = None
+            shared_state.close()
+
+    def _publish_state(self):
+        shared_state = self._shared_state
+        if shared_state is not None:
+            shared_state.publish(self._program)
 
     def pad_update(self):
-        if  self._running:
-            on_array = []
-            off_array = []
-            blink_array = []
-            for pad in Pads.ALL_PADS:
-                state = self._pads.get_state(self._program, pad)
-                if state == Pad.BLINK:
-                    blink_array.append(pad)
-                elif state != Pad.OFF:
-                    on_array.append(pad)
-                else:
-                    off_array.append(pad)
-            self.pad_on(self._program, on_array + blink_array)
-            self.pad_off(self._program, off_array)
-            blink_timer = Timer(self._blink, self.pad_off, [self._program, blink_array])
-            blink_timer.start()
+        """
+        Requests an immediate rendering of pad LEDs. LEDs are driven by the LED engine, so this method does not
+        need to be called periodically anymore
+        :return: True if LPD8 is running, False otherwise
+        """
+        if self._running:
+            self._leds.refresh()
             return True
         else:
             return False
 
+    def _send_message(self, message):
+        self._transport.send_message(message)
+
+    def _measure_send_message(self, message):
+        self._transport.send_message(message)
+        self._metrics.count_sent()
+
     def pad_on(self, program, pads):
         if self._running:
             for pad in pads:
                 note_on = [self.NOTE_ON + program - 1, pad, 1]
-                self._midi_out.send_message(note_on)
+                self._writer.send_led(note_on)
+                self._leds.set_lit(program, pad, True)
             return True
         else:
             return False
@@ -174,7 +786,8 @@ class LPD8(Thread):
         if self._running:
             for pad in pads:
                 note_off = [self.NOTE_ON + program - 1, pad, 0]
-                self._midi_out.send_message(note_off)
+                self._writer.send_led(note_off)
+                self._leds.set_lit(program, pad, False)
             return True
         else:
             return False
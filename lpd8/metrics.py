@@ -0,0 +1,240 @@
+import os
+from bisect import bisect_left
+from threading import Thread, Event, Lock
+
+
+def get_callback_name(callback_method):
+    """
+    Gets a readable name of a callback method, like Consummer.ctrl_value
+    :param callback_method: The callback method
+    :return: The name
+    """
+    return getattr(callback_method, '__qualname__', None) or repr(callback_method)
+
+
+class Histogram:
+    """
+    Class that defines a latency histogram with fixed buckets, observing a value is a single bisection
+    """
+
+    # Upper bounds of buckets in milliseconds, a last bucket holds greater values
+    BOUNDS = [.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000]
+
+    def __init__(self, bounds=BOUNDS):
+        """
+        :param bounds: Sorted upper bounds of buckets in milliseconds
+        """
+        self._bounds_ms = list(bounds)
+        self._bounds = [bound / 1000 for bound in bounds]
+        self.reset()
+
+    def reset(self):
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._count = 0
+        self._sum = 0.
+        self._max = 0.
+
+    def observe(self, value):
+        """
+        Stores a measure
+        :param value: The measure in seconds
+        """
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._sum += value
+        if value > self._max:
+            self._max = value
+
+    def get_buckets(self):
+        """
+        Gets cumulative bucket counts
+        :return: A list of (upper bound in milliseconds, count of measures lower or equal) tuples, the last bound
+                 being None for the whole count
+        """
+        buckets = []
+        cumulated = 0
+        for bound, count in zip(self._bounds_ms + [None], self._counts):
+            cumulated += count
+            buckets.append((bound, cumulated))
+        return buckets
+
+    def get(self):
+        """
+        Gets a summary of the histogram
+        :return: A dictionary with count, sum, mean and max in milliseconds and cumulative buckets
+        """
+        mean = 0.
+        if self._count != 0:
+            mean = 1000 * self._sum / self._count
+        return {
+            'count': self._count,
+            'sum_ms': round(1000 * self._sum, 6),
+            'mean_ms': round(mean, 6),
+            'max_ms': round(1000 * self._max, 6),
+            'buckets': self.get_buckets()
+        }
+
+    def to_prometheus(self, name, lines):
+        """
+        Appends the histogram in Prometheus text format to a list of lines, values are in seconds
+        :param name: The metric name
+        :param lines: The list of lines
+        """
+        lines.append('# TYPE ' + name + ' histogram')
+        for bound, count in self.get_buckets():
+            le = '+Inf' if bound is None else repr(bound / 1000)
+            lines.append('{}_bucket{{le="{}"}} {}'.format(name, le, count))
+        lines.append('{}_sum {}'.format(name, repr(self._sum)))
+        lines.append('{}_count {}'.format(name, self._count))
+
+
+class Metrics:
+    """
+    Class gathering runtime metrics of an LPD8 object:
+    - counts of received messages per event type and of messages sent to the device
+    - arrival to dispatch latency of received messages
+    - duration of callback methods, and count of callbacks slower than a threshold per callback method
+    Only the reader thread counts messages, callback durations may also be stored by worker threads
+    """
+
+    SLOW_CALLBACK = 5   # Milliseconds above which a callback is counted as slow
+
+    JSON = 'json'
+    PROMETHEUS = 'prometheus'
+
+    def __init__(self, type_names, slow_callback=SLOW_CALLBACK):
+        """
+        :param type_names: A dictionary giving the name of each counted message type, by status with channel bits
+                           masked, as defined by the LPD8 object
+        :param slow_callback: Milliseconds above which a callback is counted as slow
+        """
+        self._type_names = dict(type_names)
+        self._slow_callback = slow_callback / 1000
+        self._lock = Lock()     # Protects callback measures stored by several threads
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all metrics
+        """
+        with self._lock:
+            self._received = dict.fromkeys(self._type_names, 0)
+            self._other_received = 0
+            self._sent = 0
+            self._dispatch_latency = Histogram()
+            self._callback_duration = Histogram()
+            self._slow_callbacks = {}   # Callback name -> count
+
+    def count_received(self, message):
+        """
+        Counts a message received from the device
+        :param message: The MIDI message
+        """
+        event_type = message[0] & 0xF0
+        if event_type in self._received:
+            self._received[event_type] += 1
+        else:
+            self._other_received += 1
+
+    def count_sent(self):
+        """
+        Counts a message sent to the device, may be called by several threads
+        """
+        with self._lock:
+            self._sent += 1
+
+    def observe_dispatch(self, latency):
+        """
+        Stores the arrival to dispatch latency of a message
+        :param latency: The latency in seconds
+        """
+        self._dispatch_latency.observe(latency)
+
+    def observe_callback(self, callback_method, duration):
+        """
+        Stores the duration of a callback method call
+        :param callback_method: The callback method
+        :param duration: The duration in seconds
+        """
+        with self._lock:
+            self._callback_duration.observe(duration)
+            if duration > self._slow_callback:
+                name = get_callback_name(callback_method)
+                self._slow_callbacks[name] = self._slow_callbacks.get(name, 0) + 1
+
+    def get(self):
+        """
+        Gets all metrics
+        :return: A dictionary with message counts, latency and duration histograms and slow callback counts
+        """
+        with self._lock:
+            received = {}
+            for event_type, name in self._type_names.items():
+                received[name] = self._received[event_type]
+            received['other'] = self._other_received
+            return {
+                'received': received,
+                'sent': self._sent,
+                'dispatch_latency': self._dispatch_latency.get(),
+                'callback_duration': self._callback_duration.get(),
+                'slow_callback_ms': 1000 * self._slow_callback,
+                'slow_callbacks': dict(self._slow_callbacks)
+            }
+
+    def to_prometheus(self):
+        """
+        Formats all metrics in Prometheus text exposition format, as read by the node exporter textfile collector
+        :return: The metrics as a string
+        """
+        with self._lock:
+            lines = ['# TYPE lpd8_received_messages_total counter']
+            for event_type, name in self._type_names.items():
+                lines.append('lpd8_received_messages_total{{type="{}"}} {}'.format(name, self._received[event_type]))
+            lines.append('lpd8_received_messages_total{{type="other"}} {}'.format(self._other_received))
+            lines.append('# TYPE lpd8_sent_messages_total counter')
+            lines.append('lpd8_sent_messages_total {}'.format(self._sent))
+            self._dispatch_latency.to_prometheus('lpd8_dispatch_latency_seconds', lines)
+            self._callback_duration.to_prometheus('lpd8_callback_duration_seconds', lines)
+            lines.append('# TYPE lpd8_slow_callbacks_total counter')
+            for name, count in self._slow_callbacks.items():
+                lines.append('lpd8_slow_callbacks_total{{callback="{}"}} {}'.format(
+                    name.replace('\\', '\\\\').replace('"', '\\"'), count))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsDumper(Thread):
+    """
+    Class defining a background thread that periodically writes metrics to a file, either as JSON or in Prometheus
+    text format. The file is replaced atomically, so that readers never see a partial file
+    """
+
+    INTERVAL = 10   # Seconds between two dumps
+
+    def __init__(self, get_content, path, interval=INTERVAL):
+        """
+        :param get_content: A method returning the file content as a string
+        :param path: The file path
+        :param interval: Seconds between two dumps
+        """
+        Thread.__init__(self, name='lpd8-metrics', daemon=True)
+        self._get_content = get_content
+        self._path = path
+        self._interval = interval
+        self._stopped = Event()
+
+    def dump(self):
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w') as metrics_file:
+            metrics_file.write(self._get_content())
+        os.replace(temp_path, self._path)
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self.dump()
+        self.dump()
+
+    def stop(self):
+        """
+        Stops the thread, metrics are written one last time
+        """
+        self._stopped.set()
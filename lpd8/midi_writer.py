@@ -0,0 +1,128 @@
+from collections import deque
+from threading import Thread, Lock, Condition
+from time import sleep, perf_counter
+
+
+class MidiWriter(Thread):
+    """
+    Class defining the thread that sends MIDI messages to the device, so that a slow USB write never stops the
+    reader and rtmidi output is only used by one thread
+    Messages wait in a bounded queue. LED messages sent with send_led replace a pending LED message for the same
+    channel and note, so the queue only holds the latest state of each LED. Other messages, like routed notes, are
+    never merged. Messages are sent at most RATE per second, not to overrun the device. When the queue is full, the
+    oldest message other than a LED message is dropped, so that LEDs always end up in the state the LED engine
+    expects. LED messages are queued anyway, their number being bounded by the number of LEDs
+    """
+
+    RATE = 1000         # Maximum messages per second, None for no limit
+    QUEUE_SIZE = 256    # Maximum number of pending messages, only LED messages may exceed it
+
+    def __init__(self, send_message, rate=RATE, queue_size=QUEUE_SIZE):
+        """
+        :param send_message: The method writing a MIDI message to the device, only called by the writer thread
+        :param rate: Maximum messages sent per second, None for no limit
+        :param queue_size: Maximum number of pending messages, only LED messages may exceed it
+        """
+        Thread.__init__(self, name='lpd8-writer', daemon=True)
+        self._send_message = send_message
+        self._interval = 0 if rate is None else 1 / rate
+        self._size = queue_size
+        self._items = deque()       # [merge key, message] entries
+        self._pending = {}          # Merge key -> pending entry
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._running = False
+        self._sent = 0
+        self._merged = 0
+        self._dropped = 0
+        self._errors = 0
+
+    def send_message(self, message):
+        """
+        Queues a message, may be called by any thread. Same as Transport.send_message, so a writer may be used as a
+        router output
+        :param message: The MIDI message as a list of bytes
+        """
+        self._put(None, message)
+
+    def send_led(self, message):
+        """
+        Queues a LED message, replacing a pending LED message for the same channel and note
+        :param message: The NOTE ON message setting the LED, as a list of bytes
+        """
+        self._put((message[0], message[1]), message)
+
+    def _put(self, key, message):
+        with self._lock:
+            if key is not None:
+                entry = self._pending.get(key)
+                if entry is not None:
+                    entry[1] = message
+                    self._merged += 1
+                    return
+            if len(self._items) >= self._size:
+                oldest = next((entry for entry in self._items if entry[0] is None), None)
+                if oldest is not None:
+                    self._items.remove(oldest)
+                    self._dropped += 1
+                elif key is None:
+                    # Only LED messages are pending, the new message is dropped
+                    self._dropped += 1
+                    return
+            entry = [key, message]
+            self._items.append(entry)
+            if key is not None:
+                self._pending[key] = entry
+            self._not_empty.notify()
+
+    def start(self):
+        self._running = True
+        Thread.start(self)
+
+    def run(self):
+        next_send = perf_counter()
+        while True:
+            with self._lock:
+                while self._running and len(self._items) == 0:
+                    self._not_empty.wait()
+                # Pending messages are still sent when stopping
+                if len(self._items) == 0:
+                    break
+            # Messages keep being merged while the writer waits for its next turn
+            delay = next_send - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            with self._lock:
+                entry = self._items.popleft()
+                if self._pending.get(entry[0]) is entry:
+                    del self._pending[entry[0]]
+            now = perf_counter()
+            try:
+                self._send_message(entry[1])
+                self._sent += 1
+            except Exception:
+                import traceback
+                self._errors += 1
+                traceback.print_exc()
+            next_send = max(next_send, now) + self._interval
+
+    def stop(self):
+        """
+        Stops the writer once pending messages are sent
+        """
+        with self._lock:
+            self._running = False
+            self._not_empty.notify()
+
+    def get_stats(self):
+        """
+        Gets writer counters
+        :return: A dictionary with queue depth and sent, merged, dropped and failed message counts
+        """
+        return {
+            'depth': len(self._items),
+            'sent': self._sent,
+            'merged': self._merged,
+            'dropped': self._dropped,
+            'errors': self._errors
+        }
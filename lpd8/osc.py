@@ -0,0 +1,255 @@
+import socket
+import struct
+from queue import Queue, Empty
+from functools import partial
+from threading import Thread, Lock
+from time import perf_counter
+from lpd8.lpd8 import LPD8
+
+
+_IMMEDIATELY = struct.pack('>Q', 1)     # OSC time tag meaning "now"
+_BUNDLE = b'#bundle\x00' + _IMMEDIATELY
+_INT = struct.Struct('>i')
+_FLOAT = struct.Struct('>f')
+
+
+def encode_string(value):
+    """
+    Encodes an OSC string, null terminated and padded to a multiple of 4 bytes
+    :param value: The string
+    :return: The encoded bytes
+    """
+    data = value.encode('utf-8')
+    return data + b'\x00' * (4 - len(data) % 4)
+
+
+def encode_message(address, args=()):
+    """
+    Encodes an OSC message, int arguments are sent as int32, float arguments as float32 and others as strings
+    :param address: The OSC address, like /lpd8/4/knob/1
+    :param args: The list of arguments
+    :return: The encoded bytes
+    """
+    tags = ','
+    data = []
+    for arg in args:
+        if isinstance(arg, int):
+            tags += 'i'
+            data.append(_INT.pack(arg))
+        elif isinstance(arg, float):
+            tags += 'f'
+            data.append(_FLOAT.pack(arg))
+        else:
+            tags += 's'
+            data.append(encode_string(str(arg)))
+    return encode_string(address) + encode_string(tags) + b''.join(data)
+
+
+def encode_bundles(messages, max_size):
+    """
+    Encodes OSC messages in bundles to be executed immediately
+    :param messages: A list of encoded OSC messages
+    :param max_size: Maximum size of a bundle in bytes, messages are spread over several bundles if needed
+    :return: The list of encoded bundles
+    """
+    bundles = []
+    chunks = [_BUNDLE]
+    size = len(_BUNDLE)
+    for message in messages:
+        if size + 4 + len(message) > max_size and len(chunks) > 1:
+            bundles.append(b''.join(chunks))
+            chunks = [_BUNDLE]
+            size = len(_BUNDLE)
+        chunks.append(_INT.pack(len(message)))
+        chunks.append(message)
+        size += 4 + len(message)
+    if len(chunks) > 1:
+        bundles.append(b''.join(chunks))
+    return bundles
+
+
+class _Destination:
+    """
+    Class defining an OSC destination and its rate limit
+    """
+
+    def __init__(self, address, rate):
+        self.address = address
+        self.period = 0 if rate is None else 1 / rate
+        self.next_time = 0
+        self.pending = {}   # OSC address -> encoded message, only used by rate limited destinations
+
+
+class OscBridge(Thread):
+    """
+    Class defining a bridge sending LPD8 events as OSC messages over UDP
+    Events are gathered on the reader thread while a batch of messages is processed, and all of them are handed
+    over to the bridge thread at the end of the batch, to be sent in a single OSC bundle per destination
+    A destination may be rate limited: events arriving before its next allowed send are merged, keeping the latest
+    value of each OSC address, and sent together as soon as allowed
+    Addresses are built from templates using {device}, {program} and {id} fields
+    """
+
+    TEMPLATES = {
+        LPD8.NOTE_ON: '/lpd8/{program}/pad/{id}/on',
+        LPD8.NOTE_OFF: '/lpd8/{program}/pad/{id}/off',
+        LPD8.CTRL: '/lpd8/{program}/knob/{id}',
+        LPD8.PGM_CHG: '/lpd8/{program}/pgm/{id}'
+    }
+
+    MAX_SIZE = 1472     # Maximum bundle size in bytes, fits in a single ethernet frame
+
+    def __init__(self, templates=None, max_size=MAX_SIZE):
+        """
+        :param templates: A dictionary of address templates by event type, default TEMPLATES are used for missing
+                          event types. An event type mapped to None is not sent
+        :param max_size: Maximum bundle size in bytes
+        """
+        Thread.__init__(self, name='lpd8-osc', daemon=True)
+        self._templates = dict(self.TEMPLATES)
+        if templates is not None:
+            self._templates.update(templates)
+        self._max_size = max_size
+        self._addresses = {}        # (device, event type, program, object ID) -> OSC address
+        self._destinations = []
+        self._lock = Lock()
+        self._pending = []          # Encoded messages of the current batch, only used by the reader thread
+        self._queue = Queue()
+        self._attached = []         # (LPD8 object, [subscription handles])
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._running = False
+        self._bundles = 0
+        self._messages = 0
+        self._merged = 0
+        self._errors = 0
+
+    def add_destination(self, host, port, rate=None):
+        """
+        Adds a destination
+        :param host: The host name or IP address
+        :param port: The UDP port
+        :param rate: Maximum number of bundles per second, no limit if None
+        """
+        destination = _Destination((socket.gethostbyname(host), port), rate)
+        with self._lock:
+            self._destinations = self._destinations + [destination]
+
+    def attach(self, lpd8, program=None):
+        """
+        Sends events of an LPD8 object
+        :param lpd8: The LPD8 object
+        :param program: The program as defined in Program class, None for all programs
+        """
+        handles = []
+        for event_type, template in self._templates.items():
+            if template is not None:
+                handles.append(lpd8.subscribe(partial(self._on_event, lpd8.get_device_id(), event_type), program,
+                                              event_type, lpd8.ANY, inline=True, records=True))
+        lpd8.add_flush_hook(self._flush)
+        self._attached.append((lpd8, handles))
+
+    def detach(self):
+        """
+        Stops sending events of all attached LPD8 objects
+        """
+        for lpd8, handles in self._attached:
+            lpd8.remove_subscription(handles)
+            lpd8.remove_flush_hook(self._flush)
+        self._attached = []
+
+    def _get_address(self, device, event_type, program, object_id):
+        key = (device, event_type, program, object_id)
+        address = self._addresses.get(key)
+        if address is None:
+            address = self._templates[event_type].format(device=device, program=program, id=object_id)
+            self._addresses[key] = address
+        return address
+
+    def _on_event(self, device, event_type, event):
+        # Called on the reader thread for each event
+        address = self._get_address(device, event_type, event.program, event.object_id)
+        self._pending.append((address, encode_message(address, () if event.value is None else (event.value,))))
+
+    def _flush(self):
+        # Called on the reader thread at the end of each batch
+        if len(self._pending) != 0:
+            self._queue.put(self._pending)
+            self._pending = []
+
+    def _send(self, destination, messages):
+        for bundle in encode_bundles(messages, self._max_size):
+            try:
+                self._socket.sendto(bundle, destination.address)
+                self._bundles += 1
+            except OSError:
+                self._errors += 1
+        self._messages += len(messages)
+
+    def _send_batch(self, batch):
+        unlimited = None
+        for destination in self._destinations:
+            if destination.period == 0:
+                if unlimited is None:
+                    unlimited = [message for address, message in batch]
+                self._send(destination, unlimited)
+            else:
+                pending = destination.pending
+                for address, message in batch:
+                    if address in pending:
+                        # Keeps the latest value, at the position of the latest update
+                        del pending[address]
+                        self._merged += 1
+                    pending[address] = message
+
+    def _send_due(self):
+        # Sends merged messages of rate limited destinations whose period is over
+        # :return: Seconds until the next destination may send, None if nothing is pending
+        now = perf_counter()
+        timeout = None
+        for destination in self._destinations:
+            if len(destination.pending) != 0:
+                if now >= destination.next_time:
+                    self._send(destination, list(destination.pending.values()))
+                    destination.pending = {}
+                    destination.next_time = now + destination.period
+                else:
+                    remaining = destination.next_time - now
+                    if timeout is None or remaining < timeout:
+                        timeout = remaining
+        return timeout
+
+    def run(self):
+        self._running = True
+        timeout = None
+        while self._running:
+            try:
+                batch = self._queue.get(timeout=timeout)
+                if batch is None:
+                    break
+                self._send_batch(batch)
+            except Empty:
+                pass
+            timeout = self._send_due()
+
+    def stop(self):
+        """
+        Stops the bridge thread, detaches LPD8 objects and closes the socket
+        """
+        self.detach()
+        self._running = False
+        self._queue.put(None)
+        if self.is_alive():
+            self.join()
+        self._socket.close()
+
+    def get_stats(self):
+        """
+        Gets bridge counters
+        :return: A dictionary with sent bundle and message counts, messages merged by rate limits and send errors
+        """
+        return {
+            'bundles': self._bundles,
+            'messages': self._messages,
+            'merged': self._merged,
+            'errors': self._errors
+        }
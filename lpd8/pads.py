@@ -1,95 +1,103 @@
+from array import array
 from lpd8.programs import Programs
 
 class Pad:
     """
     Class that defines a single pad
     A pad can have multiple modes and these modes may be combined
+    A pad is a light view on one entry of a Pads array, which stores modes and states of all pads in flat arrays.
+    A pad built on its own gets its own single entry array
     """
 
+    __slots__ = ('_pads', '_program', '_pad')
+
     NO_MODE = 0     # Doesn't react to user actions
     SWITCH_MODE = 1 # Switches between 1 and 0 values, both sent at NOTE ON and NOTE OFF events
     PUSH_MODE = 2   # Always sends a 1 at Note ON event and a 0 at NOTE OFF event
     PAD_MODE = 4    # Default mode, acts as a normal pad (sends note value and velocity)
     BLINK_MODE = 8  # May be combined with above modes. Blinks pad at each pad_update call
 
+    # Gesture modes, may be combined with above modes and with each other
+    LONG_PRESS_MODE = 16    # Sends a LONG_PRESS event when pad is held long enough
+    DOUBLE_TAP_MODE = 32    # Sends a DOUBLE_TAP event when pad is hit twice quickly
+    HOLD_REPEAT_MODE = 64   # Sends HOLD_REPEAT events periodically while pad is held
+
+    ACTIONS = SWITCH_MODE | PUSH_MODE | PAD_MODE                    # Mask of action modes
+    GESTURES = LONG_PRESS_MODE | DOUBLE_TAP_MODE | HOLD_REPEAT_MODE  # Mask of gesture modes
+
     OFF = 0
     ON = 1
     BLINK = 2
 
-    def __init__(self, mode=PAD_MODE):
-        self.set_mode(mode)
-        self._state = self.OFF
+    def __init__(self, mode=PAD_MODE, pads=None, program=1, pad=60):
+        """
+        :param mode: The pad mode, only used for a pad built on its own
+        :param pads: The Pads array holding this pad, a new single pad array if None
+        :param program: The program of this pad in the Pads array
+        :param pad: The pad as defined in Pads class
+        """
+        if pads is None:
+            pads = Pads(1, 1)
+            pads.set_mode(program, pad, mode)
+        self._pads = pads
+        self._program = program
+        self._pad = pad
 
     def get_state(self):
         """
         According to the working mode of the pad, returns appropriate value
         :return: The state value
         """
-        state = self.OFF
-        if self.get_mode(without_blink_mode=False) >= self.BLINK_MODE:
-            if self._state == self.ON:
-                state = self.ON
-            else:
-                state = self.BLINK
-        elif self._state == self.ON:
-            state = self.ON
-        return state
+        return self._pads.get_state(self._program, self._pad)
 
     def get_mode(self, without_blink_mode=True):
         """
         Get defined action for this pad. We need this method to get only the action without the blink mode
-        :return: mode value without BLINK mode
+        :return: mode value without gesture modes, and without BLINK mode unless it is the only mode
         """
-        if self._mode > self.BLINK_MODE and without_blink_mode:
-            return self._mode - self.BLINK_MODE
+        if without_blink_mode:
+            return self._pads.get_mode(self._program, self._pad)
         else:
-            return self._mode
+            return self._pads.get_full_mode(self._program, self._pad)
 
     def set_mode(self, mode):
         """
         Sets pad mode
         :param mode: The desired mode - blink mode may be combined with all others
         """
-        self._mode = mode
+        self._pads.set_mode(self._program, self._pad, mode)
+
+    def dump(self):
+        """
+        Gets pad mode and state, used to save LPD8 state
+        :return: A (mode, state) tuple
+        """
+        return self._pads.dump(self._program, self._pad)
+
+    def restore(self, dump):
+        """
+        Restores pad mode and state
+        :param dump: A tuple as returned by dump
+        """
+        self._pads.restore(self._program, self._pad, dump)
 
     def set_switch_state(self, state):
-        if self.get_mode() == self.SWITCH_MODE and (state == self.OFF or state == self.ON):
-            self._state = state
-            return True
-        else:
-            return False
+        return self._pads.set_switch_state(self._program, self._pad, state)
 
     def note_on(self, velocity):
-        mode = self.get_mode()
-        if mode == self.SWITCH_MODE:
-            if self._state == self.ON:
-                self._state = self.OFF
-            else:
-                self._state = self.ON
-            return self._state
-        elif mode == self.PUSH_MODE:
-            self._state = self.ON
-            return self._state
-        elif mode == self.PAD_MODE:
-            self._state = self.ON
-            return velocity
-        else:
-            return None
+        return self._pads.note_on(self._program, self._pad, velocity)
 
     def note_off(self):
-        mode = self.get_mode()
-        if mode == self.SWITCH_MODE:
-            return self._state
-        elif mode == self.PUSH_MODE or mode == self.PAD_MODE:
-            self._state = self.OFF
-            return self._state
-        else:
-            return None
+        return self._pads.note_off(self._program, self._pad)
 
 
 class Pads:
     """
     Class that defines a full array of pads (8 pads in each program so 4 X 8 = 32 pads in total
+    Pad modes and states are stored in flat typed arrays indexed by (program - 1) * pads + pad position (0 to 7)
+    Each state change increments a version counter, stored for the changed pad and counted for its program, see Knobs
+    The LED state of every pad (OFF, ON or BLINK) is kept in a frame per program, updated at each mode or state
+    change, so that the LEDs of a program are rendered without evaluating pad modes
     """
 
     PAD_1 = 60
@@ -115,27 +123,175 @@ class Pads:
         PAD_8: 8
     }
 
+    # Pad position (0 to 7) of every MIDI note, None for notes that are not pads
+    _positions = [None] * 128
+    for _pad, _index in _pad_index.items():
+        _positions[_pad] = _index - 1
+    del _pad, _index
+
     def __init__(self, programs=Programs.PGM_MAX, pads=PAD_MAX):
-        self._pads = []
-        for program in range(programs + 1):
-            self._pads.append([])
-            for pad in range(pads + 1):
-                self._pads[program].append(Pad())
+        self._programs = programs
+        self._count = pads
+        # Index of the first pad of each program, so that a pad index is offsets[program] + position
+        self._offsets = [None] + [(program - 1) * pads for program in range(1, programs + 1)]
+        size = programs * pads
+        self._modes = array('B', [Pad.PAD_MODE]) * size
+        self._actions = array('B', [Pad.PAD_MODE]) * size    # Modes without BLINK mode and gesture modes
+        self._states = array('B', [Pad.OFF]) * size
+        self._frames = array('B', [Pad.OFF]) * size         # LED states ordered by program then pad position
+        self._version = 0                               # Number of state changes
+        self._versions = [0] * size                     # Version of the last state change of each pad
+        self._program_versions = [0] * (programs + 1)   # Number of state changes of each program
+
+    def _get_index(self, program, pad):
+        return self._offsets[program] + self._positions[pad]
+
+    def _update_frame(self, index):
+        if self._states[index] == Pad.ON:
+            self._frames[index] = Pad.ON
+        elif self._modes[index] & Pad.BLINK_MODE:
+            self._frames[index] = Pad.BLINK
+        else:
+            self._frames[index] = Pad.OFF
+
+    def _set_state(self, index, state):
+        # Sets a pad state, counting a change only if the state is different
+        if self._states[index] != state:
+            self._states[index] = state
+            self._update_frame(index)
+            self._version += 1
+            self._versions[index] = self._version
+            self._program_versions[index // self._count + 1] += 1
+
+    def get_pad(self, program, pad):
+        return Pad(pads=self, program=program, pad=pad)
 
     def get_mode(self, program, pad):
-        return self._pads[program][self._pad_index[pad]].get_mode()
+        """
+        Gets pad mode without gesture modes, and without BLINK mode unless the pad is in BLINK mode only, see
+        Pad.get_mode
+        """
+        mode = self._modes[self._get_index(program, pad)] & (Pad.ACTIONS | Pad.BLINK_MODE)
+        if mode > Pad.BLINK_MODE:
+            return mode - Pad.BLINK_MODE
+        return mode
+
+    def get_full_mode(self, program, pad):
+        """
+        Gets pad mode including BLINK mode and gesture modes
+        """
+        return self._modes[self._get_index(program, pad)]
+
+    def get_gestures(self, program, pad):
+        """
+        Gets gesture modes of a pad
+        :return: The combination of gesture modes, 0 if the pad has none or if the note is not a pad
+        """
+        position = self._positions[pad]
+        if position is None:
+            return 0
+        return self._modes[self._offsets[program] + position] & Pad.GESTURES
 
     def set_mode(self, program, pad, mode):
-        self._pads[program][self._pad_index[pad]].set_mode(mode)
+        index = self._get_index(program, pad)
+        self._modes[index] = mode
+        self._actions[index] = mode & Pad.ACTIONS
+        self._update_frame(index)
+
+    def dump(self, program, pad):
+        """
+        Gets pad mode and state, see Pad.dump
+        """
+        index = self._get_index(program, pad)
+        return self._modes[index], self._states[index]
+
+    def restore(self, program, pad, dump):
+        """
+        Restores pad mode and state, see Pad.restore
+        """
+        self.set_mode(program, pad, dump[0])
+        self._set_state(self._get_index(program, pad), dump[1])
 
     def note_on(self, program, pad, velocity):
-        return self._pads[program][self._pad_index[pad]].note_on(velocity)
+        position = self._positions[pad]
+        if position is None:
+            return None
+        index = self._offsets[program] + position
+        mode = self._actions[index]
+        if mode == Pad.SWITCH_MODE:
+            state = Pad.OFF if self._states[index] == Pad.ON else Pad.ON
+            self._set_state(index, state)
+            return state
+        elif mode == Pad.PUSH_MODE:
+            self._set_state(index, Pad.ON)
+            return Pad.ON
+        elif mode == Pad.PAD_MODE:
+            self._set_state(index, Pad.ON)
+            return velocity
+        else:
+            return None
 
     def note_off(self, program, pad):
-        return self._pads[program][self._pad_index[pad]].note_off()
+        position = self._positions[pad]
+        if position is None:
+            return None
+        index = self._offsets[program] + position
+        mode = self._actions[index]
+        if mode == Pad.SWITCH_MODE:
+            return self._states[index]
+        elif mode == Pad.PUSH_MODE or mode == Pad.PAD_MODE:
+            self._set_state(index, Pad.OFF)
+            return Pad.OFF
+        else:
+            return None
 
     def set_switch_state(self, program, pad, state):
-        return self._pads[program][self._pad_index[pad]].set_switch_state(state)
+        index = self._get_index(program, pad)
+        if self._actions[index] == Pad.SWITCH_MODE and (state == Pad.OFF or state == Pad.ON):
+            self._set_state(index, state)
+            return True
+        else:
+            return False
 
     def get_state(self, program, pad):
-        return self._pads[program][self._pad_index[pad]].get_state()
+        return self._frames[self._get_index(program, pad)]
+
+    def get_frame(self, program):
+        """
+        Gets LED states of all pads of a program
+        :param program: The program
+        :return: LED states (OFF, ON or BLINK) as bytes ordered by pad position
+        """
+        start = self._offsets[program]
+        return self._frames[start:start + self._count].tobytes()
+
+    def get_states(self):
+        """
+        Gets states of all pads
+        :return: Pad states (OFF or ON) as bytes ordered by program then pad position
+        """
+        return self._states.tobytes()
+
+    def get_versions(self):
+        """
+        Gets version counters, see Knobs.get_versions
+        :return: A (version, per program versions, per pad versions) tuple
+        """
+        version = self._version
+        return version, tuple(self._program_versions), tuple(self._versions)
+
+    def get_version(self):
+        return self._version
+
+    def reset(self, program=None):
+        """
+        Switches off all pads of a program, modes are kept
+        :param program: The program, all programs if None
+        """
+        if program is None:
+            start, end = 0, self._programs * self._count
+        else:
+            start = self._offsets[program]
+            end = start + self._count
+        for index in range(start, end):
+            self._set_state(index, Pad.OFF)
@@ -0,0 +1,182 @@
+import struct
+from threading import Thread, Event
+from time import perf_counter, sleep, time
+
+
+class Recorder(Thread):
+    """
+    Class defining a session recorder, that streams every raw incoming MIDI message with its arrival time to a binary
+    log file
+    The reader thread only packs messages in a preallocated ring buffer, a background thread appends them to the
+    file. If the file cannot be written fast enough and the ring is full, new messages are dropped and counted
+    File layout (little endian):
+    - header: magic 'LPD8REC', format version, wall clock time of the first message
+    - one record per message: nanoseconds since the first message, message length and up to 3 message bytes
+    """
+
+    MAGIC = b'LPD8REC'
+    VERSION = 1
+
+    CAPACITY = 4096     # Number of messages the ring buffer may hold
+    FLUSH = 100         # Milliseconds between two writes to the file
+
+    _HEADER = struct.Struct('<7sBd')
+    _RECORD = struct.Struct('<QB3s')
+    _MAX_LENGTH = 3
+
+    def __init__(self, path, capacity=CAPACITY, flush=FLUSH):
+        """
+        :param path: The log file path, an existing file is replaced
+        :param capacity: Number of messages the ring buffer may hold
+        :param flush: Milliseconds between two writes to the file
+        """
+        Thread.__init__(self, name='lpd8-recorder', daemon=True)
+        self._path = path
+        self._capacity = capacity
+        self._flush = flush / 1000
+        self._ring = bytearray(capacity * self._RECORD.size)
+        self._head = 0          # Number of messages packed, only changed by the reader thread
+        self._tail = 0          # Number of messages written, only changed by the recorder thread
+        self._epoch = None
+        self._epoch_time = 0.
+        self._dropped = 0
+        self._skipped = 0
+        self._stopped = Event()
+        self._log_file = open(path, 'wb')
+        self._log_file.write(self._HEADER.pack(self.MAGIC, self.VERSION, 0.))
+
+    def record(self, message, arrival):
+        """
+        Packs a message in the ring buffer, called by the reader thread
+        :param message: The MIDI message
+        :param arrival: The arrival time (time.perf_counter clock)
+        """
+        head = self._head
+        if head - self._tail >= self._capacity:
+            self._dropped += 1
+            return
+        length = len(message)
+        if length > self._MAX_LENGTH:
+            self._skipped += 1
+            return
+        if self._epoch is None:
+            self._epoch = arrival
+            self._epoch_time = time() - (perf_counter() - arrival)
+        self._RECORD.pack_into(self._ring, head % self._capacity * self._RECORD.size,
+                               int((arrival - self._epoch) * 1000000000), length, bytes(message))
+        self._head = head + 1
+
+    def _write(self):
+        # Appends packed messages to the file, in two chunks when they wrap around the end of the ring
+        head = self._head
+        tail = self._tail
+        if head == tail:
+            return
+        size = self._RECORD.size
+        start = tail % self._capacity
+        end = start + head - tail
+        if end <= self._capacity:
+            self._log_file.write(self._ring[start * size:end * size])
+        else:
+            self._log_file.write(self._ring[start * size:])
+            self._log_file.write(self._ring[:(end - self._capacity) * size])
+        self._log_file.flush()
+        self._tail = head
+
+    def run(self):
+        while not self._stopped.wait(self._flush):
+            self._write()
+        self._write()
+        if self._epoch is not None:
+            self._log_file.seek(0)
+            self._log_file.write(self._HEADER.pack(self.MAGIC, self.VERSION, self._epoch_time))
+        self._log_file.close()
+
+    def stop(self):
+        """
+        Stops the thread, pending messages are written and the file is closed
+        """
+        self._stopped.set()
+
+    def get_stats(self):
+        """
+        Gets recorder counters
+        :return: A dictionary with recorded, written, dropped (ring full) and skipped (too long) message counts
+        """
+        return {
+            'recorded': self._head,
+            'written': self._tail,
+            'dropped': self._dropped,
+            'skipped': self._skipped
+        }
+
+
+class Replayer:
+    """
+    Class used to read a log written by a Recorder and to feed it back to an LPD8 object through a transport that
+    accepts injected messages, like LoopbackTransport
+    """
+
+    ORIGINAL = 1.0  # Replays messages at their original timing
+    FASTEST = None  # Replays messages as fast as possible
+
+    def __init__(self, path):
+        """
+        :param path: The log file path
+        :raise ValueError: If the file is not a valid log of this LPD8 version
+        """
+        with open(path, 'rb') as log_file:
+            data = log_file.read()
+        header_size = Recorder._HEADER.size
+        try:
+            magic, version, start_time = Recorder._HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError('Truncated LPD8 log')
+        if magic != Recorder.MAGIC or version != Recorder.VERSION:
+            raise ValueError('Not an LPD8 log or unsupported log version')
+        self._start_time = start_time
+        # A record partially written when the recorder was interrupted is ignored
+        end = header_size + (len(data) - header_size) // Recorder._RECORD.size * Recorder._RECORD.size
+        self._records = []
+        for timestamp, length, message in Recorder._RECORD.iter_unpack(data[header_size:end]):
+            self._records.append((timestamp / 1000000000, list(message[:length])))
+
+    def get_start_time(self):
+        """
+        Gets the wall clock time of the first recorded message
+        :return: Seconds since the epoch, as returned by time.time
+        """
+        return self._start_time
+
+    def get_records(self):
+        """
+        Gets recorded messages
+        :return: A list of (seconds since the first message, MIDI message) tuples
+        """
+        return self._records
+
+    def get_duration(self):
+        if len(self._records) == 0:
+            return 0.
+        return self._records[-1][0]
+
+    def play(self, transport, speed=ORIGINAL):
+        """
+        Injects recorded messages in a transport, returns when all messages are injected
+        :param transport: A transport with an inject method, like LoopbackTransport
+        :param speed: Speed factor, ORIGINAL (1.0) keeps original timing, 2.0 plays twice faster. FASTEST (None)
+                      injects messages as fast as possible
+        :return: The number of injected messages
+        """
+        inject = transport.inject
+        if speed is None:
+            for timestamp, message in self._records:
+                inject(message)
+        else:
+            start = perf_counter()
+            for timestamp, message in self._records:
+                delay = start + timestamp / speed - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+                inject(message)
+        return len(self._records)
@@ -0,0 +1,147 @@
+from threading import Lock
+from lpd8.lpd8 import LPD8
+from lpd8.programs import Programs
+
+
+class Router:
+    """
+    Class that translates incoming LPD8 messages into outgoing MIDI messages without calling any callback method
+    Rules map (program, event type, control) to an output message template and a value scaling. They are compiled
+    into a flat table indexed by the status and first data bytes of incoming messages, so routing a message is a
+    single lookup, a 128 entries scaling table lookup and a send
+    Routing is done by the reader on raw messages, before knob and pad processing
+    """
+
+    ANY = LPD8.ANY
+    VALUE = -1      # Template placeholder replaced by the scaled value
+    CONTROL = -2    # Template placeholder replaced by the incoming control, pad or program change number
+
+    NOTE_OFF = LPD8.NOTE_OFF
+    NOTE_ON = LPD8.NOTE_ON
+    CTRL = LPD8.CTRL
+    PGM_CHG = LPD8.PGM_CHG
+
+    _MIDI_STEPS = 127
+
+    def __init__(self, output=None):
+        """
+        :param output: Default output of rules, an object with a send_message method like a Transport or an opened
+                       rtmidi.MidiOut
+        """
+        self._output = output
+        self._rules = []
+        self._table = [None] * (256 * 128)     # (status << 7) + first data byte -> tuple of compiled rules
+        self._lock = Lock()
+        self._routed = 0
+
+    def _build_scale(self, low, high, curve):
+        # Builds the table giving the output value of each input value
+        scale = []
+        for value in range(self._MIDI_STEPS + 1):
+            level = value / self._MIDI_STEPS
+            if curve is not None:
+                level = curve(level)
+            output = int(round(low + (high - low) * level))
+            scale.append(min(max(output, 0), self._MIDI_STEPS))
+        return scale
+
+    def add_rule(self, program, event_type, control, message, low=0, high=127, curve=None, output=None):
+        """
+        Adds a routing rule
+        :param program: The program as defined in Program class or ANY
+        :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL or PGM_CHG)
+        :param control: The knob, pad or program change MIDI number or ANY
+        :param message: The output message template, a list of bytes where VALUE is replaced by the scaled value and
+                        CONTROL by the incoming control number, like [176, 7, Router.VALUE]
+        :param low: The output value of the lowest input value
+        :param high: The output value of the highest input value
+        :param curve: If given, a function mapping the input position (0 to 1) to an output level (0 to 1)
+        :param output: The output of this rule, the router default output if None
+        :return: A rule handle, to be used with remove_rule
+        """
+        if output is None:
+            output = self._output
+        template = tuple(message)
+        control_index = template.index(self.CONTROL) if self.CONTROL in template else None
+        value_index = template.index(self.VALUE) if self.VALUE in template else None
+        rule = (program, event_type, control,
+                (output.send_message, template, control_index, value_index, self._build_scale(low, high, curve)))
+        with self._lock:
+            self._rules.append(rule)
+            self._compile()
+        return rule
+
+    def remove_rule(self, rule):
+        """
+        Removes a rule
+        :param rule: The handle returned by add_rule
+        :return: True if the rule existed, False otherwise
+        """
+        with self._lock:
+            if rule not in self._rules:
+                return False
+            self._rules.remove(rule)
+            self._compile()
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._rules = []
+            self._compile()
+
+    def _compile(self):
+        # Builds a new table and replaces the current one in a single assignment, so the reader never sees a table
+        # being built
+        table = [None] * (256 * 128)
+        for program, event_type, control, compiled in self._rules:
+            programs = range(1, Programs.PGM_MAX + 1) if program is self.ANY else [program]
+            controls = range(self._MIDI_STEPS + 1) if control is self.ANY else [control]
+            for rule_program in programs:
+                status = event_type + rule_program - 1
+                for rule_control in controls:
+                    index = (status << 7) + rule_control
+                    if table[index] is None:
+                        table[index] = (compiled,)
+                    else:
+                        table[index] = table[index] + (compiled,)
+        self._table = table
+
+    def route(self, message):
+        """
+        Sends the output messages of an incoming message
+        :param message: The incoming MIDI message
+        :return: True if at least one rule matched, False otherwise
+        """
+        rules = self._table[(message[0] << 7) + message[1]]
+        if rules is None:
+            return False
+        value = message[2] if len(message) > 2 else message[1]
+        for send_message, template, control_index, value_index, scale in rules:
+            output = list(template)
+            if control_index is not None:
+                output[control_index] = message[1]
+            if value_index is not None:
+                output[value_index] = scale[value]
+            send_message(output)
+        self._routed += 1
+        return True
+
+    def route_batch(self, batch):
+        """
+        Routes a batch of messages, called by the reader
+        :param batch: A list of (MIDI message, arrival time) tuples
+        """
+        table = self._table
+        for message, arrival in batch:
+            if len(message) > 1 and table[(message[0] << 7) + message[1]] is not None:
+                self.route(message)
+
+    def get_stats(self):
+        """
+        Gets router counters
+        :return: A dictionary with the number of rules and the number of routed messages
+        """
+        return {
+            'rules': len(self._rules),
+            'routed': self._routed
+        }
@@ -0,0 +1,356 @@
+import asyncio
+import json
+import struct
+from base64 import b64encode
+from functools import partial
+from hashlib import sha1
+from threading import Thread, Event
+from lpd8.knobs import Knobs
+from lpd8.lpd8 import LPD8
+from lpd8.pads import Pads
+from lpd8.programs import Programs
+
+SYNC = 0    # Kind of full state frames in binary encoding
+
+JSON = 0    # Newline delimited JSON objects
+BINARY = 1  # Fixed size little endian records
+
+_EVENT_NAMES = {
+    LPD8.NOTE_ON: 'note_on',
+    LPD8.NOTE_OFF: 'note_off',
+    LPD8.CTRL: 'ctrl',
+    LPD8.PGM_CHG: 'pgm_chg'
+}
+
+# Binary records:
+# - event: kind (event type), device ID (0 for a standalone LPD8), program, object ID, value (NaN if none)
+# - full state: kind SYNC, device ID, active program, 0, knob values ordered by program then knob (NaN for knobs
+#   never read or set), pad states ordered by program then pad position
+_EVENT = struct.Struct('<BBBBd')
+_SYNC = struct.Struct('<BBBB' + str(Programs.PGM_MAX * Knobs.KNOB_MAX) + 'd' +
+                      str(Programs.PGM_MAX * Pads.PAD_MAX) + 's')
+
+_NAN = float('nan')
+
+_WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_WS_TEXT = 0x1
+_WS_BINARY = 0x2
+_WS_CLOSE = 0x8
+_WS_PING = 0x9
+_WS_PONG = 0xA
+
+
+def encode_event(encoding, device, event_type, program, object_id, value):
+    """
+    Encodes an event
+    :param encoding: JSON or BINARY
+    :param device: The device ID, None for a standalone LPD8
+    :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL or PGM_CHG)
+    :param program: The program
+    :param object_id: The knob, pad or program change ID
+    :param value: The event value, None for program changes
+    :return: The encoded bytes
+    """
+    if encoding == BINARY:
+        return _EVENT.pack(event_type, device or 0, program, object_id, _NAN if value is None else value)
+    return json.dumps({'type': _EVENT_NAMES[event_type], 'device': device, 'program': program, 'id': object_id,
+                       'value': value}, separators=(',', ':')).encode() + b'\n'
+
+
+def encode_sync(encoding, device, snapshot):
+    """
+    Encodes the full state of a device
+    :param encoding: JSON or BINARY
+    :param device: The device ID, None for a standalone LPD8
+    :param snapshot: A Snapshot object of all programs
+    :return: The encoded bytes
+    """
+    values = snapshot.get_knob_values()
+    states = snapshot.get_pad_states()
+    if encoding == BINARY:
+        return _SYNC.pack(SYNC, device or 0, snapshot.get_active_program(), 0,
+                          *[_NAN if value is None else value for value in values], states)
+    return json.dumps({'type': 'sync', 'device': device, 'program': snapshot.get_active_program(),
+                       'knobs': list(values), 'pads': list(states)}, separators=(',', ':')).encode() + b'\n'
+
+
+def encode_websocket_frame(opcode, payload):
+    """
+    Encodes an unmasked WebSocket frame, as sent by a server
+    :param opcode: The frame opcode
+    :param payload: The payload bytes
+    :return: The encoded frame
+    """
+    size = len(payload)
+    if size < 126:
+        header = struct.pack('>BB', 0x80 | opcode, size)
+    elif size < 65536:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, size)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, size)
+    return header + payload
+
+
+class _Client:
+    """
+    Class defining a connected client and its send buffer
+    Events waiting to be sent are kept by control, so a client falling behind only gets the latest value of each
+    control once it catches up
+    """
+
+    def __init__(self, writer, websocket):
+        self.writer = writer
+        self.websocket = websocket
+        self.pending = {}       # (device, event type, program, object ID) -> encoded event
+        self.ready = asyncio.Event()
+        self.task = None
+
+
+class EventServer(Thread):
+    """
+    Class defining a server streaming LPD8 events to local clients over plain TCP and WebSocket
+    The server runs its own asyncio event loop on its own thread. Events are gathered on the reader thread while a
+    batch of messages is processed and handed over to the loop at the end of the batch, where they are encoded once
+    and queued to every client. Each client gets a full state frame when it connects, then events
+    """
+
+    HOST = '127.0.0.1'
+
+    def __init__(self, host=HOST, tcp_port=None, websocket_port=None, encoding=JSON):
+        """
+        :param host: The address to listen on
+        :param tcp_port: The plain TCP port, 0 to choose a free port, None for no plain TCP server
+        :param websocket_port: The WebSocket port, 0 to choose a free port, None for no WebSocket server
+        :param encoding: JSON for newline delimited JSON objects (sent in text frames over WebSocket) or BINARY for
+                         fixed size records (sent in binary frames over WebSocket)
+        """
+        Thread.__init__(self, name='lpd8-server', daemon=True)
+        self._host = host
+        self._ports = {False: tcp_port, True: websocket_port}
+        self._addresses = {}        # Websocket flag -> (host, port) bound
+        self._encoding = encoding
+        self._loop = asyncio.new_event_loop()
+        self._servers = []
+        self._clients = set()
+        self._attached = []         # (LPD8 object, [subscription handles], flush hook)
+        self._listening = Event()
+        self._error = None
+        self._connections = 0
+        self._events = 0
+        self._merged = 0
+
+    def attach(self, lpd8):
+        """
+        Streams events of an LPD8 object, clients connecting afterwards get its full state
+        :param lpd8: The LPD8 object
+        """
+        pending = []    # Events of the current batch, only used by the reader thread of this LPD8 object
+        handles = []
+        for event_type in _EVENT_NAMES:
+            handles.append(lpd8.subscribe(partial(self._on_event, pending, lpd8.get_device_id(), event_type),
+                                          lpd8.ANY, event_type, lpd8.ANY, inline=True, records=True))
+        flush_hook = partial(self._flush, pending)
+        lpd8.add_flush_hook(flush_hook)
+        self._attached.append((lpd8, handles, flush_hook))
+
+    def detach(self):
+        """
+        Stops streaming events of all attached LPD8 objects
+        """
+        for lpd8, handles, flush_hook in self._attached:
+            lpd8.remove_subscription(handles)
+            lpd8.remove_flush_hook(flush_hook)
+        self._attached = []
+
+    def _on_event(self, pending, device, event_type, event):
+        # Called on the reader thread for each event
+        pending.append((device, event_type, event.program, event.object_id, event.value))
+
+    def _flush(self, pending):
+        # Called on the reader thread at the end of each batch
+        if len(pending) != 0:
+            batch = list(pending)
+            del pending[:]
+            try:
+                self._loop.call_soon_threadsafe(self._broadcast, batch)
+            except RuntimeError:
+                # Event loop is closed, events are lost
+                pass
+
+    def _broadcast(self, batch):
+        # Runs in the event loop
+        encoding = self._encoding
+        events = [((device, event_type, program, object_id),
+                   encode_event(encoding, device, event_type, program, object_id, value))
+                  for device, event_type, program, object_id, value in batch]
+        self._events += len(events)
+        for client in self._clients:
+            pending = client.pending
+            for key, data in events:
+                if key in pending:
+                    # Keeps the latest value, at the position of the latest update
+                    del pending[key]
+                    self._merged += 1
+                pending[key] = data
+            client.ready.set()
+
+    def _frame(self, client, data):
+        if client.websocket:
+            return encode_websocket_frame(_WS_BINARY if self._encoding == BINARY else _WS_TEXT, data)
+        return data
+
+    async def _write(self, client):
+        # Sends pending events of a client, events arriving while a write is drained are merged
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                pending = client.pending
+                client.pending = {}
+                client.writer.write(self._frame(client, b''.join(pending.values())))
+                await client.writer.drain()
+        except ConnectionError:
+            # The reading side of the connection ends the client
+            client.writer.close()
+
+    async def _handshake(self, reader, writer):
+        # Answers a WebSocket opening handshake
+        # :return: True if the handshake succeeded, False otherwise
+        request = await reader.readuntil(b'\r\n\r\n')
+        key = None
+        for line in request.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'sec-websocket-key':
+                key = value.strip()
+        if key is None:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            return False
+        accept = b64encode(sha1(key + _WEBSOCKET_GUID).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        return True
+
+    async def _read_websocket(self, reader, writer):
+        # Reads client frames until the connection is closed, answering pings
+        while True:
+            header = await reader.readexactly(2)
+            opcode = header[0] & 0x0F
+            size = header[1] & 0x7F
+            if size == 126:
+                size = struct.unpack('>H', await reader.readexactly(2))[0]
+            elif size == 127:
+                size = struct.unpack('>Q', await reader.readexactly(8))[0]
+            mask = await reader.readexactly(4) if header[1] & 0x80 else None
+            payload = await reader.readexactly(size)
+            if mask is not None:
+                payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+            if opcode == _WS_CLOSE:
+                writer.write(encode_websocket_frame(_WS_CLOSE, payload[:2]))
+                return
+            elif opcode == _WS_PING:
+                writer.write(encode_websocket_frame(_WS_PONG, payload))
+
+    async def _read_tcp(self, reader):
+        # Ignores anything sent by the client until the connection is closed
+        while len(await reader.read(4096)) != 0:
+            pass
+
+    async def _serve(self, websocket, reader, writer):
+        client = None
+        try:
+            if websocket and not await self._handshake(reader, writer):
+                return
+            client = _Client(writer, websocket)
+            # Full state and registration happen without yielding to the loop, so no event is missed in between
+            sync = b''.join(encode_sync(self._encoding, lpd8.get_device_id(), lpd8.snapshot())
+                            for lpd8, handles, flush_hook in self._attached)
+            if len(sync) != 0:
+                writer.write(self._frame(client, sync))
+            self._clients.add(client)
+            self._connections += 1
+            client.task = self._loop.create_task(self._write(client))
+            if websocket:
+                await self._read_websocket(reader, writer)
+            else:
+                await self._read_tcp(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            if client is not None:
+                self._clients.discard(client)
+                if client.task is not None:
+                    client.task.cancel()
+            writer.close()
+
+    async def _start_servers(self):
+        for websocket, port in self._ports.items():
+            if port is not None:
+                server = await asyncio.start_server(partial(self._serve, websocket), self._host, port)
+                self._servers.append(server)
+                self._addresses[websocket] = server.sockets[0].getsockname()[:2]
+
+    def run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._start_servers())
+        except OSError as error:
+            self._error = error
+        self._listening.set()
+        if self._error is None:
+            self._loop.run_forever()
+        self._loop.close()
+
+    def start(self):
+        """
+        Starts the server thread and waits until servers listen
+        :raise OSError: If a port could not be bound
+        """
+        Thread.start(self)
+        self._listening.wait()
+        if self._error is not None:
+            self.join()
+            raise self._error
+
+    async def _shutdown(self):
+        for server in self._servers:
+            server.close()
+        for client in list(self._clients):
+            client.writer.close()
+            if client.task is not None:
+                client.task.cancel()
+        self._clients.clear()
+
+    def stop(self):
+        """
+        Detaches LPD8 objects, disconnects clients and stops the server thread
+        """
+        self.detach()
+        if self.is_alive():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self.join()
+
+    def get_tcp_address(self):
+        """
+        :return: The (host, port) plain TCP address listened on, None if there is no plain TCP server
+        """
+        return self._addresses.get(False)
+
+    def get_websocket_address(self):
+        """
+        :return: The (host, port) WebSocket address listened on, None if there is no WebSocket server
+        """
+        return self._addresses.get(True)
+
+    def get_stats(self):
+        """
+        Gets server counters
+        :return: A dictionary with the number of connected clients, connections since start, broadcast events and
+                 events merged in client send buffers
+        """
+        return {
+            'clients': len(self._clients),
+            'connections': self._connections,
+            'events': self._events,
+            'merged': self._merged
+        }
@@ -0,0 +1,156 @@
+import struct
+from threading import Lock
+from time import sleep
+from lpd8.programs import Programs
+from lpd8.knobs import Knobs
+from lpd8.pads import Pads
+
+# Block layout (little endian, native alignment of 8 bytes values):
+# - header: magic 'LPD8', layout version, number of programs, knobs and pads, active program
+# - sequence counter, odd while the writer is updating the block
+# - one float64 value per knob ordered by program then knob, NaN for knobs never read or set
+# - one byte state per pad ordered by program then pad position
+_HEADER = struct.Struct('<4sHBBBB')
+_SEQUENCE = struct.Struct('<Q')
+_SEQUENCE_OFFSET = 16
+_KNOBS_OFFSET = _SEQUENCE_OFFSET + _SEQUENCE.size
+_KNOBS = struct.Struct('<' + str(Programs.PGM_MAX * Knobs.KNOB_MAX) + 'd')
+_PADS_OFFSET = _KNOBS_OFFSET + _KNOBS.size
+_PADS_SIZE = Programs.PGM_MAX * Pads.PAD_MAX
+_SIZE = _PADS_OFFSET + _PADS_SIZE
+
+MAGIC = b'LPD8'
+VERSION = 1
+
+_NAN = float('nan')
+
+
+def _get_shared_memory():
+    # Shared memory is only available from Python 3.8
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise RuntimeError('Shared state needs multiprocessing.shared_memory (Python 3.8 or later)')
+    return shared_memory
+
+
+class SharedState:
+    """
+    Class publishing knob values and pad states of all programs in a shared memory block, so that other processes
+    read them without any message passing
+    The block is protected by a sequence counter (seqlock): the writer makes it odd before updating the block and
+    even again afterwards, readers retry when the counter was odd or changed while they were copying the block
+    """
+
+    def __init__(self, knobs, pads, name=None):
+        """
+        :param knobs: The Knobs object to publish
+        :param pads: The Pads object to publish
+        :param name: The shared memory block name, a unique name is chosen if None
+        """
+        shared_memory = _get_shared_memory()
+        self._knobs = knobs
+        self._pads = pads
+        self._memory = shared_memory.SharedMemory(name, create=True, size=_SIZE)
+        self._buffer = self._memory.buf
+        self._sequence = 0
+        self._lock = Lock()     # Serializes writers, readers never lock
+        _HEADER.pack_into(self._buffer, 0, MAGIC, VERSION, Programs.PGM_MAX, Knobs.KNOB_MAX, Pads.PAD_MAX, 0)
+        self.publish()
+
+    def get_name(self):
+        """
+        Gets the shared memory block name, to be given to SharedStateReader objects
+        :return: The name
+        """
+        return self._memory.name
+
+    def publish(self, program=None):
+        """
+        Copies current knob values and pad states to the block
+        :param program: If not None, the active program is published too
+        """
+        values = [_NAN if value is None else value for value in self._knobs.get_values()]
+        states = self._pads.get_states()
+        with self._lock:
+            buffer = self._buffer
+            if buffer is None:
+                return
+            self._sequence += 1
+            _SEQUENCE.pack_into(buffer, _SEQUENCE_OFFSET, self._sequence)
+            if program is not None:
+                buffer[_HEADER.size - 1] = program
+            _KNOBS.pack_into(buffer, _KNOBS_OFFSET, *values)
+            buffer[_PADS_OFFSET:_SIZE] = states
+            self._sequence += 1
+            _SEQUENCE.pack_into(buffer, _SEQUENCE_OFFSET, self._sequence)
+
+    def close(self):
+        """
+        Releases and destroys the block, readers keep their last mapping until they close it
+        """
+        with self._lock:
+            if self._buffer is None:
+                return
+            self._buffer.release()
+            self._buffer = None
+        self._memory.close()
+        self._memory.unlink()
+
+
+class SharedStateReader:
+    """
+    Class reading a block published by a SharedState object, usually from another process
+    Reading is a copy of the block from shared memory, retried if the writer updated it meanwhile
+    """
+
+    RETRY = .0001   # Seconds waited before reading again a block being updated
+
+    def __init__(self, name):
+        """
+        :param name: The shared memory block name, as returned by SharedState.get_name
+        :raise ValueError: If the block is not an LPD8 state block of this version
+        """
+        shared_memory = _get_shared_memory()
+        try:
+            self._memory = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Before Python 3.13, attaching registers the block in the resource tracker, which would destroy it when
+            # this process ends, so the reader unregisters it
+            from multiprocessing import resource_tracker
+            self._memory = shared_memory.SharedMemory(name)
+            resource_tracker.unregister(self._memory._name, 'shared_memory')
+        self._buffer = self._memory.buf
+        magic, version, programs, knobs, pads, program = _HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('Not an LPD8 state block or unsupported version')
+
+    def read(self):
+        """
+        Reads a consistent snapshot of the block
+        :return: A (sequence, active program, knob values, pad states) tuple, knob values being a list of float values
+                 ordered by program then knob (NaN for knobs never read or set) and pad states bytes ordered by program
+                 then pad position. Active program is 0 if never published
+        """
+        buffer = self._buffer
+        while True:
+            sequence = _SEQUENCE.unpack_from(buffer, _SEQUENCE_OFFSET)[0]
+            if sequence % 2 == 0:
+                data = bytes(buffer[:_SIZE])
+                if _SEQUENCE.unpack_from(buffer, _SEQUENCE_OFFSET)[0] == sequence:
+                    break
+            sleep(self.RETRY)
+        return (sequence, data[_HEADER.size - 1], list(_KNOBS.unpack_from(data, _KNOBS_OFFSET)),
+                data[_PADS_OFFSET:_SIZE])
+
+    def get_sequence(self):
+        """
+        Gets the sequence counter, which changes each time the block is published
+        :return: The sequence counter
+        """
+        return _SEQUENCE.unpack_from(self._buffer, _SEQUENCE_OFFSET)[0]
+
+    def close(self):
+        self._buffer.release()
+        self._memory.close()
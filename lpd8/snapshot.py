@@ -0,0 +1,129 @@
+from lpd8.programs import Programs
+from lpd8.knobs import Knobs
+from lpd8.pads import Pads
+
+
+class Snapshot:
+    """
+    Class defining an immutable view of knob values and pad states of one or all programs, taken at a given time
+    Version counters are read before values, so a value may be newer than its version but never older: a control
+    changed while the snapshot was taken is reported again by the next snapshot, never missed
+    Snapshots are meant to be compared with the previous one in a frame loop, see get_changes
+    """
+
+    __slots__ = ('_program', '_first', '_count', '_knob_version', '_pad_version', '_program_versions',
+                 '_knob_versions', '_pad_versions', '_knob_values', '_pad_states')
+
+    def __init__(self, knobs, pads, active_program, program=None):
+        """
+        :param knobs: The Knobs object
+        :param pads: The Pads object
+        :param active_program: The program whose pads are rendered
+        :param program: The program of the snapshot as defined in Program class, all programs if None
+        """
+        self._program = active_program
+        self._first = 1 if program is None else program
+        self._count = Programs.PGM_MAX if program is None else 1
+        self._knob_version, knob_program_versions, knob_versions = knobs.get_versions()
+        self._pad_version, pad_program_versions, pad_versions = pads.get_versions()
+        self._program_versions = tuple(knob_version + pad_version for knob_version, pad_version
+                                       in zip(knob_program_versions, pad_program_versions))
+        knob_start, knob_end = self._get_range(Knobs.KNOB_MAX)
+        pad_start, pad_end = self._get_range(Pads.PAD_MAX)
+        self._knob_versions = knob_versions[knob_start:knob_end]
+        self._pad_versions = pad_versions[pad_start:pad_end]
+        self._knob_values = tuple(knobs.get_values()[knob_start:knob_end])
+        self._pad_states = pads.get_states()[pad_start:pad_end]
+
+    def _get_range(self, size):
+        start = (self._first - 1) * size
+        return start, start + self._count * size
+
+    def get_version(self):
+        """
+        Gets the global change counter, equal in two snapshots if nothing changed between them
+        :return: The number of knob value and pad state changes
+        """
+        return self._knob_version + self._pad_version
+
+    def get_program_version(self, program):
+        """
+        Gets the change counter of a program, which may be read from any snapshot
+        :param program: The program as defined in Program class
+        :return: The number of knob value and pad state changes of this program
+        """
+        return self._program_versions[program]
+
+    def get_programs(self):
+        """
+        :return: The list of programs of the snapshot
+        """
+        return list(range(self._first, self._first + self._count))
+
+    def get_active_program(self):
+        """
+        :return: The program whose pads were rendered when the snapshot was taken
+        """
+        return self._program
+
+    def get_knob_value(self, program, knob):
+        """
+        Gets a knob value
+        :param program: The program as defined in Program class
+        :param knob: The knob as defined in Knobs class
+        :return: The knob value, None if the knob was never read or set
+        :raise IndexError: If the program is not in the snapshot
+        """
+        return self._knob_values[self._get_index(program, Knobs.KNOB_MAX, knob - 1)]
+
+    def get_pad_state(self, program, pad):
+        """
+        Gets a pad state
+        :param program: The program as defined in Program class
+        :param pad: The pad as defined in Pads class
+        :return: Pad.ON or Pad.OFF
+        :raise IndexError: If the program is not in the snapshot
+        """
+        return self._pad_states[self._get_index(program, Pads.PAD_MAX, Pads.ALL_PADS.index(pad))]
+
+    def _get_index(self, program, size, position):
+        if not self._first <= program < self._first + self._count:
+            raise IndexError('Program ' + str(program) + ' is not in the snapshot')
+        return (program - self._first) * size + position
+
+    def get_knob_values(self):
+        """
+        :return: A tuple of knob values ordered by program then knob, None for knobs never read or set
+        """
+        return self._knob_values
+
+    def get_pad_states(self):
+        """
+        :return: Pad states (OFF or ON) as bytes ordered by program then pad position
+        """
+        return self._pad_states
+
+    def get_changes(self, previous=None):
+        """
+        Gets controls changed since a previous snapshot of the same programs
+        :param previous: The previous snapshot, all controls are returned if None or if it holds other programs
+        :return: A (knob changes, pad changes) tuple, knob changes being a list of (program, knob, value) tuples
+                 and pad changes a list of (program, pad, state) tuples
+        """
+        knob_version = pad_version = -1
+        if previous is not None and previous._first == self._first and previous._count == self._count:
+            if previous.get_version() == self.get_version():
+                return [], []
+            knob_version = previous._knob_version
+            pad_version = previous._pad_version
+        knob_changes = []
+        for index, version in enumerate(self._knob_versions):
+            if version > knob_version:
+                knob_changes.append((self._first + index // Knobs.KNOB_MAX, index % Knobs.KNOB_MAX + 1,
+                                     self._knob_values[index]))
+        pad_changes = []
+        for index, version in enumerate(self._pad_versions):
+            if version > pad_version:
+                pad_changes.append((self._first + index // Pads.PAD_MAX, Pads.ALL_PADS[index % Pads.PAD_MAX],
+                                    self._pad_states[index]))
+        return knob_changes, pad_changes
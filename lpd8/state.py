@@ -0,0 +1,193 @@
+import os
+import struct
+from threading import Thread, Event
+from lpd8.programs import Programs
+from lpd8.knobs import Knobs
+from lpd8.pads import Pads
+
+
+class StateStore:
+    """
+    Class used to save and restore knob and pad states of all programs in a compact binary format
+    File layout (little endian):
+    - header: magic 'LPD8', format version, number of programs, knobs and pads
+    - one record per knob: min, max and increment values, flags, curve, sync gap, value and MIDI value, followed by
+      128 curve values for knobs using a custom curve
+    - one record per pad: mode and state
+    """
+
+    MAGIC = b'LPD8'
+    VERSION = 1
+
+    _HEADER = struct.Struct('<4sHBBB')
+    _KNOB = struct.Struct('<dddBBhdh')
+    _RAW_TABLE = struct.Struct('<128d')
+    _PAD = struct.Struct('<BB')
+
+    # Knob flags
+    _IS_INT = 1
+    _STICKY = 2
+    _HAS_VALUE = 4
+    _HAS_MIDI_VALUE = 8
+    _CUSTOM_CURVE = 255
+
+    def __init__(self, knobs, pads):
+        """
+        :param knobs: The Knobs object to save or restore
+        :param pads: The Pads object to save or restore
+        """
+        self._knobs = knobs
+        self._pads = pads
+
+    def pack(self):
+        """
+        Packs knob and pad states
+        :return: The packed states as bytes
+        """
+        chunks = [self._HEADER.pack(self.MAGIC, self.VERSION, Programs.PGM_MAX, Knobs.KNOB_MAX, Pads.PAD_MAX)]
+        for program in range(1, Programs.PGM_MAX + 1):
+            for knob in Knobs.ALL_KNOBS:
+                min_value, max_value, inc, is_int, curve, sticky, sync, value, midi_value, raw_table = \
+                    self._knobs.get_knob(program, knob).dump()
+                flags = 0
+                if is_int:
+                    flags += self._IS_INT
+                if sticky:
+                    flags += self._STICKY
+                if value is not None:
+                    flags += self._HAS_VALUE
+                if midi_value is not None:
+                    flags += self._HAS_MIDI_VALUE
+                chunks.append(self._KNOB.pack(min_value, max_value, inc, flags,
+                                              self._CUSTOM_CURVE if curve is None else curve, sync,
+                                              0 if value is None else value, 0 if midi_value is None else midi_value))
+                if raw_table is not None:
+                    chunks.append(self._RAW_TABLE.pack(*raw_table))
+        for program in range(1, Programs.PGM_MAX + 1):
+            for pad in Pads.ALL_PADS:
+                chunks.append(self._PAD.pack(*self._pads.get_pad(program, pad).dump()))
+        return b''.join(chunks)
+
+    def unpack(self, data):
+        """
+        Restores knob and pad states, nothing is changed if data is not valid
+        :param data: Packed states as returned by pack
+        :raise ValueError: If data is not a valid state of this LPD8 version
+        """
+        try:
+            magic, version, programs, knobs, pads = self._HEADER.unpack_from(data)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError('Not an LPD8 state or unsupported state version')
+            if programs != Programs.PGM_MAX or knobs != Knobs.KNOB_MAX or pads != Pads.PAD_MAX:
+                raise ValueError('State does not match LPD8 layout')
+            offset = self._HEADER.size
+            knob_dumps = []
+            for index in range(programs * knobs):
+                min_value, max_value, inc, flags, curve, sync, value, midi_value = self._KNOB.unpack_from(data, offset)
+                offset += self._KNOB.size
+                raw_table = None
+                if curve == self._CUSTOM_CURVE:
+                    curve = None
+                    raw_table = list(self._RAW_TABLE.unpack_from(data, offset))
+                    offset += self._RAW_TABLE.size
+                is_int = flags & self._IS_INT != 0
+                if flags & self._HAS_VALUE == 0:
+                    value = None
+                elif is_int:
+                    value = int(value)
+                if flags & self._HAS_MIDI_VALUE == 0:
+                    midi_value = None
+                knob_dumps.append((min_value, max_value, inc, is_int, curve, flags & self._STICKY != 0, sync, value,
+                                   midi_value, raw_table))
+            pad_dumps = []
+            for index in range(programs * pads):
+                pad_dumps.append(self._PAD.unpack_from(data, offset))
+                offset += self._PAD.size
+        except struct.error:
+            raise ValueError('Truncated LPD8 state')
+        index = 0
+        for program in range(1, programs + 1):
+            for knob in Knobs.ALL_KNOBS:
+                self._knobs.get_knob(program, knob).restore(knob_dumps[index])
+                index += 1
+        index = 0
+        for program in range(1, programs + 1):
+            for pad in Pads.ALL_PADS:
+                self._pads.get_pad(program, pad).restore(pad_dumps[index])
+                index += 1
+
+    def write(self, path, data):
+        """
+        Writes packed states to a file, the file is replaced atomically
+        :param path: The file path
+        :param data: Packed states as returned by pack
+        """
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as state_file:
+            state_file.write(data)
+        os.replace(temp_path, path)
+
+    def save(self, path):
+        """
+        Saves knob and pad states to a file
+        :param path: The file path
+        """
+        self.write(path, self.pack())
+
+    def load(self, path):
+        """
+        Restores knob and pad states from a file, in a single read
+        :param path: The file path
+        :return: True if states were restored, False if the file does not exist
+        :raise ValueError: If the file is not a valid state of this LPD8 version
+        """
+        try:
+            with open(path, 'rb') as state_file:
+                data = state_file.read()
+        except FileNotFoundError:
+            return False
+        self.unpack(data)
+        return True
+
+
+class Autosaver(Thread):
+    """
+    Class defining a background thread that periodically saves knob and pad states
+    States are packed and written by this thread, so the MIDI reader is never blocked. The file is only written
+    when states changed since the last save
+    """
+
+    INTERVAL = 2    # Seconds between two saves
+
+    def __init__(self, store, path, interval=INTERVAL):
+        """
+        :param store: The StateStore object
+        :param path: The file path
+        :param interval: Seconds between two saves
+        """
+        Thread.__init__(self, name='lpd8-autosave', daemon=True)
+        self._store = store
+        self._path = path
+        self._interval = interval
+        self._stopped = Event()
+        self._last_data = None
+
+    def save(self):
+        """
+        Saves states if they changed since the last save
+        """
+        data = self._store.pack()
+        if data != self._last_data:
+            self._store.write(self._path, data)
+            self._last_data = data
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self.save()
+        self.save()
+
+    def stop(self):
+        """
+        Stops the thread, states are saved one last time
+        """
+        self._stopped.set()
@@ -1,13 +1,40 @@
+from time import perf_counter
+
+
 class Subscriber:
     """
     Class that defines a subscriber to a specific event
+    A subscriber is also the handle returned when subscribing, it may be used to remove the subscription
     """
 
-    def __init__(self, callback_method, program, event_type, object_id):
+    def __init__(self, callback_method, program, event_type, object_id, records=False):
+        """
+        :param callback_method: The callback method
+        :param program: The program as defined in Program class or ANY
+        :param event_type: The event type (NOTE_ON, NOTE_OFF, CTRL or PGM_CHG)
+        :param object_id: The knob, pad or program change ID or ANY
+        :param records: If True, the callback method gets MidiEvent records, [program, object ID, value] lists
+                        otherwise
+        """
         self._callback_method = callback_method
         self._program = program
         self._event_type = event_type
         self._object_id = object_id
+        self._records = records
+
+    def get_key(self):
+        """
+        Gets the key used to index this subscriber in the dispatcher
+        :return: A (program, event type, object ID) tuple
+        """
+        return self._program, self._event_type, self._object_id
+
+    def get_callback(self):
+        """
+        Gets the subscribed callback method
+        :return: The callback method
+        """
+        return self._callback_method
 
     def match(self, program, event_type, object_id):
         """
@@ -21,14 +48,22 @@ class Subscriber:
             match = True
         return match
 
-    def notify(self, program, object_id, data):
+    def notify(self, event):
         """
-        Call the subscriber (subscribed method of an object) and send available data if any
-        :param program: The program as defined in Program class
-        :param object_id: The knob, pad or program change ID
-        :param data: The data to send to the subscriber for processing if any
+        Call the subscriber (subscribed method of an object) with the event record, or with the data list of the
+        event for callback methods written before records existed
+        :param event: The MidiEvent record, only valid during the call
         """
-        if data == None:
-            self._callback_method([program, object_id])
+        if self._records:
+            self._callback_method(event)
         else:
-            self._callback_method([program, object_id, data])
+            self._callback_method(event.to_list())
+
+    def measure_notify(self, event, metrics):
+        """
+        Same as notify, the duration of the callback method is stored in a Metrics object
+        :param metrics: The Metrics object
+        """
+        start = perf_counter()
+        self.notify(event)
+        metrics.observe_callback(self._callback_method, perf_counter() - start)
@@ -0,0 +1,125 @@
+from time import perf_counter
+
+
+class Timer:
+    """
+    Class defining a timer scheduled in a TimerWheel, also used as a handle to cancel it
+    """
+
+    __slots__ = ('due', 'tick', 'callback_method', 'args')
+
+    def __init__(self, due, tick, callback_method, args):
+        self.due = due
+        self.tick = tick
+        self.callback_method = callback_method
+        self.args = args
+
+
+class TimerWheel:
+    """
+    Class defining a hashed timer wheel: timers are stored in a ring of slots, one slot per tick, a timer due in more
+    than a full turn staying in its slot until its turn comes. Scheduling and cancelling cost the same whatever the
+    number of timers
+    The wheel has no thread of its own, it is advanced by the thread that owns it (the reader), which waits at most
+    get_timeout seconds for its next message. A wheel must only be used by that thread
+    """
+
+    TICK = 1        # Milliseconds per slot
+    SLOTS = 512     # Number of slots, a turn lasts SLOTS ticks
+
+    def __init__(self, tick=TICK, slots=SLOTS, now=None):
+        """
+        :param tick: Milliseconds per slot, timers fire at most one tick late
+        :param slots: Number of slots
+        :param now: The start time as given by time.perf_counter, the current time if None
+        """
+        self._tick = tick / 1000
+        self._size = slots
+        self._slots = [{} for slot in range(slots)]     # Timer -> None, dictionaries keep scheduling order
+        self._current = self._get_tick(perf_counter() if now is None else now)     # Last tick processed
+        self._count = 0
+
+    def _get_tick(self, now):
+        return int(now / self._tick)
+
+    def schedule(self, due, callback_method, *args):
+        """
+        Schedules a callback method
+        :param due: The time the callback method is due, as given by time.perf_counter
+        :param callback_method: The method to call, it gets the due time followed by args
+        :param args: Arguments given to the callback method
+        :return: A Timer object, to be used with cancel
+        """
+        # Rounded up, so that a timer never fires early
+        tick = self._get_tick(due)
+        if tick * self._tick < due:
+            tick += 1
+        if tick <= self._current:
+            tick = self._current + 1
+        timer = Timer(due, tick, callback_method, args)
+        self._slots[tick % self._size][timer] = None
+        self._count += 1
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancels a timer
+        :param timer: The Timer object returned by schedule
+        :return: True if the timer was pending, False if it already fired or was cancelled
+        """
+        slot = self._slots[timer.tick % self._size]
+        if timer in slot:
+            del slot[timer]
+            self._count -= 1
+            return True
+        return False
+
+    def advance(self, now):
+        """
+        Fires every timer due, in due order unless the wheel was not advanced for more than a turn
+        :param now: The current time, as given by time.perf_counter
+        :return: The number of fired timers
+        """
+        if self._count == 0:
+            self._current = self._get_tick(now)
+            return 0
+        fired = 0
+        target = self._get_tick(now)
+        size = self._size
+        # A wheel left alone for more than a turn only needs one pass over every slot
+        tick = max(self._current + 1, target - size + 1)
+        while tick <= target and self._count != 0:
+            slot = self._slots[tick % size]
+            if len(slot) != 0:
+                # Other timers of the slot are due in a later turn
+                due_timers = [timer for timer in slot if timer.tick <= target]
+                for timer in due_timers:
+                    if timer in slot:
+                        del slot[timer]
+                        self._count -= 1
+                        self._current = tick
+                        timer.callback_method(timer.due, *timer.args)
+                        fired += 1
+            tick += 1
+        self._current = target
+        return fired
+
+    def get_timeout(self, now):
+        """
+        Gets the time to wait before the next timer is due
+        :param now: The current time, as given by time.perf_counter
+        :return: Seconds until the next timer is due (0 if one is late), None if no timer is pending
+        """
+        if self._count == 0:
+            return None
+        size = self._size
+        for distance in range(size):
+            tick = self._current + 1 + distance
+            for timer in self._slots[tick % size]:
+                if timer.tick == tick:
+                    return max(tick * self._tick - now, 0)
+        # Every pending timer is due in more than a turn, the wheel is checked again a turn later
+        return max((self._current + size) * self._tick - now, self._tick)
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,424 @@
+import re
+from collections import deque
+from threading import Lock
+from time import perf_counter, sleep
+
+
+class _PortCache:
+    """
+    Class enumerating MIDI ports for all transports, input and output ports being enumerated together through a
+    single pair of probe objects created at first use. Enumerations are reused for TTL milliseconds, so that opening
+    several devices or checking them all enumerates ports once
+    Ports opened by transports are also held here, so that a transport reopening a device never takes the port of
+    another device of the same name
+    """
+
+    TTL = 1000  # Milliseconds an enumeration is reused for
+
+    def __init__(self):
+        self._lock = Lock()
+        self._probes = None     # (rtmidi.MidiIn, rtmidi.MidiOut) only used to enumerate ports
+        self._ports = None      # (input port names, output port names)
+        self._time = 0
+        self._held = (set(), set())     # (input port names, output port names) opened by transports
+
+    def get_ports(self, max_age=TTL):
+        """
+        Gets input and output port names
+        :param max_age: Maximum age in milliseconds of a reused enumeration, 0 to enumerate ports again
+        :return: A (input port names, output port names) tuple, in rtmidi order
+        """
+        with self._lock:
+            now = perf_counter()
+            if self._ports is None or now - self._time > max_age / 1000:
+                if self._probes is None:
+                    import rtmidi
+                    self._probes = (rtmidi.MidiIn(), rtmidi.MidiOut())
+                self._ports = (self._probes[0].get_ports(), self._probes[1].get_ports())
+                self._time = now
+            return self._ports
+
+    def hold(self, input_name, output_name):
+        """
+        Marks ports as opened by a transport
+        :param input_name: The input port name
+        :param output_name: The output port name
+        :return: True if both ports were free, False if one of them is already held and nothing was marked
+        """
+        with self._lock:
+            if input_name in self._held[0] or output_name in self._held[1]:
+                return False
+            self._held[0].add(input_name)
+            self._held[1].add(output_name)
+            return True
+
+    def release(self, input_name, output_name):
+        with self._lock:
+            self._held[0].discard(input_name)
+            self._held[1].discard(output_name)
+
+    def is_held(self, port_name, output=False):
+        """
+        Checks that a port is opened by a transport
+        :param port_name: The port name
+        :param output: True for an output port, False for an input port
+        :return: True if the port is held, False otherwise
+        """
+        with self._lock:
+            return port_name in self._held[1 if output else 0]
+
+
+_port_cache = _PortCache()
+
+
+def list_ports(name='LPD8', max_age=_PortCache.TTL):
+    """
+    Lists MIDI input ports of a device
+    :param name: The device name
+    :param max_age: Maximum age in milliseconds of a reused port enumeration, 0 to enumerate ports again
+    :return: The list of input port names containing the device name, in rtmidi order
+    """
+    return [port_name for port_name in _port_cache.get_ports(max_age)[0] if port_name.find(name) != -1]
+
+
+def is_port_held(port_name):
+    """
+    Checks that an input port is opened by a transport
+    :param port_name: The input port name
+    :return: True if the port is held, False otherwise
+    """
+    return _port_cache.is_held(port_name)
+
+
+# Client and port numbers appended by some MIDI drivers to port names, they change when devices are plugged again
+_PORT_NUMBERS = re.compile(r'\s+\d+:\d+$')
+
+
+def get_port_key(port_name):
+    """
+    Gets the name of a port without the client and port numbers appended by some MIDI drivers
+    :param port_name: The port name
+    :return: The port name that a device keeps when it is plugged again
+    """
+    return _PORT_NUMBERS.sub('', port_name)
+
+
+class Transport:
+    """
+    Base class of MIDI transports used by the LPD8 object to exchange messages with a device
+    Incoming messages are either pulled with get_message (POLL mode) or pushed to a callback (CALLBACK mode), both
+    along with their arrival time as given by time.perf_counter
+    """
+
+    def open(self):
+        """
+        Opens input and output ports
+        :return: True if the device was found and opened, False otherwise
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Closes input and output ports
+        """
+        raise NotImplementedError
+
+    def is_open(self):
+        raise NotImplementedError
+
+    def is_connected(self):
+        """
+        Checks that the device is still connected. This may enumerate MIDI ports, so it is meant to be called by a
+        device watcher, never on the read path
+        :return: True if the device is connected and ports are open, False otherwise
+        """
+        return self.is_open()
+
+    def get_message(self):
+        """
+        Reads a pending incoming message
+        :return: A (MIDI message, arrival time) tuple, None if no message is pending
+        """
+        raise NotImplementedError
+
+    def set_callback(self, callback_method):
+        """
+        Sets the method called for each incoming message, get_message may not be used anymore
+        :param callback_method: A method getting a MIDI message and its arrival time, None to go back to polling
+        """
+        raise NotImplementedError
+
+    def send_message(self, message):
+        """
+        Sends a MIDI message to the device
+        :param message: The MIDI message as a list of bytes
+        """
+        raise NotImplementedError
+
+
+class RtMidiTransport(Transport):
+    """
+    Transport using rtmidi to exchange messages with a physical device
+    Ports are first picked by position. Once opened, the transport only reopens ports of the same names, client
+    numbers apart, which are not held by another transport, so that a device plugged again is never confused with
+    another device
+    """
+
+    # Maximum age in milliseconds of the port enumeration used to open or check a device, devices opened or checked
+    # in a row share a single enumeration
+    PORTS_AGE = 100
+
+    def __init__(self, name='LPD8', index=0):
+        """
+        :param name: The device name
+        :param index: Index of the device among connected devices, ports are first opened on the index-th input and
+                      output ports whose name contains the device name
+        """
+        self._name = name
+        self._index = index
+        self._midi_in = None
+        self._midi_out = None
+        self._port_name = None
+        self._output_name = None
+        self._port_keys = None      # (input port key, output port key) of the ports opened first
+        self._callback_method = None
+        self._last_arrival = None   # Arrival time of the last polled message
+
+    def _find_port(self, port_names, port_key=None):
+        # Gets the index and name of the index-th port whose name contains the device name, or of the first port
+        # with the given key not held by another transport
+        found = 0
+        for index, port_name in enumerate(port_names):
+            if port_key is not None:
+                if get_port_key(port_name) == port_key and not _port_cache.is_held(port_name):
+                    return index, port_name
+            elif port_name.find(self._name) != -1:
+                if found == self._index:
+                    return index, port_name
+                found += 1
+        return None, None
+
+    def _find_output(self, port_names, input_name):
+        # Gets the index and name of the output port of a device, named like its input port if such a port exists
+        if self._port_keys is None:
+            if input_name in port_names:
+                return port_names.index(input_name), input_name
+            return self._find_port(port_names)
+        for index, port_name in enumerate(port_names):
+            if get_port_key(port_name) == self._port_keys[1] and not _port_cache.is_held(port_name, True):
+                return index, port_name
+        return None, None
+
+    def open(self):
+        input_ports, output_ports = _port_cache.get_ports(self.PORTS_AGE)
+        input_key = None if self._port_keys is None else self._port_keys[0]
+        input_index, input_name = self._find_port(input_ports, input_key)
+        output_index, output_name = None, None
+        if input_index is not None:
+            output_index, output_name = self._find_output(output_ports, input_name)
+        if output_index is not None and _port_cache.hold(input_name, output_name):
+            self._port_name = input_name
+            self._output_name = output_name
+            import rtmidi
+            self._midi_in = rtmidi.MidiIn()
+            self._midi_in.open_port(input_index)
+            self._midi_out = rtmidi.MidiOut()
+            self._midi_out.open_port(output_index)
+        if self._midi_in is not None and self._midi_out is not None:
+            if self._port_keys is None:
+                self._port_keys = (get_port_key(input_name), get_port_key(output_name))
+            if self._callback_method is not None:
+                self._midi_in.set_callback(self._on_message)
+            return True
+        self.close()
+        return False
+
+    def close(self):
+        self._last_arrival = None
+        if self._midi_in is not None:
+            self._midi_in.close_port()
+            self._midi_in = None
+        if self._midi_out is not None:
+            self._midi_out.close_port()
+            self._midi_out = None
+        if self._port_name is not None:
+            _port_cache.release(self._port_name, self._output_name)
+            self._port_name = None
+            self._output_name = None
+
+    def get_port_key(self):
+        """
+        Gets the name of the input port opened first, without client numbers
+        :return: The port key, None if the device was never opened
+        """
+        if self._port_keys is None:
+            return None
+        return self._port_keys[0]
+
+    def is_open(self):
+        return self._midi_in is not None and self._midi_out is not None
+
+    def is_connected(self):
+        if not self.is_open():
+            return False
+        return self._port_name in _port_cache.get_ports(self.PORTS_AGE)[0]
+
+    def _on_message(self, event, data=None):
+        # Called by rtmidi from its own thread each time a message arrives
+        self._callback_method(event[0], perf_counter())
+
+    def get_message(self):
+        # rtmidi gives the time elapsed since the previous message, so arrival times are rebuilt from the arrival of
+        # the previous message, never later than now. The first message after a long idle time is still exact, only
+        # the first message after opening the port gets the time it was read
+        midi_in = self._midi_in
+        if midi_in is None:
+            return None
+        msg = midi_in.get_message()
+        if msg is None:
+            return None
+        now = perf_counter()
+        arrival = self._last_arrival
+        if arrival is None:
+            arrival = now
+        else:
+            arrival = min(arrival + msg[1], now)
+        self._last_arrival = arrival
+        return msg[0], arrival
+
+    def set_callback(self, callback_method):
+        self._callback_method = callback_method
+        if self._midi_in is not None:
+            if callback_method is None:
+                self._midi_in.cancel_callback()
+            else:
+                self._midi_in.set_callback(self._on_message)
+
+    def send_message(self, message):
+        # Messages sent while the device is disconnected are lost
+        midi_out = self._midi_out
+        if midi_out is not None:
+            midi_out.send_message(message)
+
+
+class LoopbackTransport(Transport):
+    """
+    In-process transport used to run the LPD8 object without a device
+    Messages injected in the transport are read by the LPD8 object as if they came from a device, and all messages
+    sent to the device are captured
+    """
+
+    def __init__(self, capture=True):
+        """
+        :param capture: If True, sent messages are stored and may be read with get_sent
+        """
+        self._open = False
+        self._plugged = True
+        self._capture = capture
+        self._pending = deque()
+        self._sent = []
+        self._sent_count = 0
+        self._sent_lock = Lock()
+        self._callback_method = None
+
+    def open(self):
+        self._open = self._plugged
+        return self._open
+
+    def close(self):
+        self._open = False
+
+    def is_open(self):
+        return self._open
+
+    def is_connected(self):
+        return self._open and self._plugged
+
+    def unplug(self):
+        """
+        Simulates a disconnection of the device, messages are neither received nor sent until it is plugged again
+        and the transport is opened again
+        """
+        self._plugged = False
+
+    def plug(self):
+        """
+        Simulates a connection of the device, the transport may be opened again
+        """
+        self._plugged = True
+
+    def inject(self, message, timestamp=None):
+        """
+        Injects an incoming message
+        :param message: The MIDI message as a list of bytes
+        :param timestamp: The arrival time (time.perf_counter clock), now if None
+        """
+        if not self.is_connected():
+            return
+        if timestamp is None:
+            timestamp = perf_counter()
+        callback_method = self._callback_method
+        if callback_method is not None:
+            callback_method(message, timestamp)
+        else:
+            self._pending.append((message, timestamp))
+
+    def inject_many(self, messages, rate=None):
+        """
+        Injects a sequence of incoming messages
+        :param messages: An iterable of MIDI messages
+        :param rate: Number of messages per second, as fast as possible if None
+        :return: The number of injected messages
+        """
+        count = 0
+        if rate is None:
+            for message in messages:
+                self.inject(message)
+                count += 1
+        else:
+            period = 1 / rate
+            start = perf_counter()
+            for message in messages:
+                delay = start + count * period - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+                self.inject(message)
+                count += 1
+        return count
+
+    def get_message(self):
+        try:
+            return self._pending.popleft()
+        except IndexError:
+            return None
+
+    def set_callback(self, callback_method):
+        self._callback_method = callback_method
+        if callback_method is not None:
+            while len(self._pending) != 0:
+                callback_method(*self._pending.popleft())
+
+    def send_message(self, message):
+        if not self.is_connected():
+            return
+        with self._sent_lock:
+            self._sent_count += 1
+            if self._capture:
+                self._sent.append(list(message))
+
+    def get_sent(self, clear=True):
+        """
+        Gets captured outgoing messages
+        :param clear: If True, captured messages are forgotten
+        :return: The list of sent MIDI messages
+        """
+        with self._sent_lock:
+            sent = self._sent
+            if clear:
+                self._sent = []
+            else:
+                sent = list(sent)
+        return sent
+
+    def get_sent_count(self):
+        return self._sent_count
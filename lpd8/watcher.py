@@ -0,0 +1,89 @@
+from threading import Thread, Event
+from time import perf_counter
+
+
+class DeviceWatcher(Thread):
+    """
+    Class defining a background thread that checks that devices are still connected and reconnects them
+    Port enumeration is only done by this thread, never on the read path. A disconnected device is reopened with an
+    exponential backoff, and LED states are sent again once it is back. Knob and pad states and subscriptions are
+    kept by the LPD8 object, so nothing has to be configured again
+    """
+
+    INTERVAL = 250      # Milliseconds between two checks of connected devices
+    BACKOFF = 10        # Milliseconds before the first reconnection attempt
+    MAX_BACKOFF = 2000  # Maximum milliseconds between two reconnection attempts
+
+    def __init__(self, get_devices, discover=None, interval=INTERVAL, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+        """
+        :param get_devices: A method returning the LPD8 objects to watch
+        :param discover: If given, a method called at each check to find new devices
+        :param interval: Milliseconds between two checks of connected devices
+        :param backoff: Milliseconds before the first reconnection attempt, doubled after each failed attempt
+        :param max_backoff: Maximum milliseconds between two reconnection attempts
+        """
+        Thread.__init__(self, name='lpd8-watcher', daemon=True)
+        self._get_devices = get_devices
+        self._discover = discover
+        self._interval = interval / 1000
+        self._backoff = backoff / 1000
+        self._max_backoff = max_backoff / 1000
+        self._lost = {}         # LPD8 object -> [disconnection time, next attempt time, next backoff]
+        self._stopped = Event()
+        self._disconnects = 0
+        self._reconnects = 0
+        self._last_downtime = None
+
+    def _check(self, now):
+        # Looks for disconnected devices and tries to reopen lost devices whose backoff is over
+        for lpd8 in self._get_devices():
+            lost = self._lost.get(lpd8)
+            if lost is None:
+                if not lpd8.is_connected():
+                    self._disconnects += 1
+                    lost = [now, now, self._backoff]
+                    self._lost[lpd8] = lost
+                else:
+                    continue
+            if now >= lost[1]:
+                if lpd8.reconnect():
+                    del self._lost[lpd8]
+                    self._reconnects += 1
+                    self._last_downtime = perf_counter() - lost[0]
+                else:
+                    lost[1] = now + lost[2]
+                    lost[2] = min(2 * lost[2], self._max_backoff)
+        if self._discover is not None:
+            self._discover()
+
+    def _get_timeout(self, now):
+        timeout = self._interval
+        for lost in self._lost.values():
+            timeout = min(timeout, max(lost[1] - now, 0))
+        return timeout
+
+    def run(self):
+        timeout = self._interval
+        while not self._stopped.wait(timeout):
+            now = perf_counter()
+            self._check(now)
+            timeout = self._get_timeout(now)
+
+    def stop(self):
+        self._stopped.set()
+
+    def get_stats(self):
+        """
+        Gets watcher counters
+        :return: A dictionary with disconnection and reconnection counts, the number of devices still lost and the
+                 last downtime in milliseconds (None if no device was reconnected yet)
+        """
+        last_downtime = None
+        if self._last_downtime is not None:
+            last_downtime = round(1000 * self._last_downtime, 3)
+        return {
+            'disconnects': self._disconnects,
+            'reconnects': self._reconnects,
+            'lost': len(self._lost),
+            'last_downtime_ms': last_downtime
+        }
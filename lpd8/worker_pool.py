@@ -0,0 +1,247 @@
+from collections import deque
+from queue import Queue
+from threading import Thread, Lock, Condition
+from time import perf_counter
+from weakref import WeakValueDictionary
+from lpd8.subscriber import Subscriber
+
+
+class SubscriberQueue:
+    """
+    Class that defines the bounded queue of notifications waiting for a single subscriber, shared by all
+    subscriptions of its callback method
+    A queue is run by at most one worker at a time, so that a subscriber receives its events in order
+    """
+
+    _SLICE = 32     # Maximum number of notifications delivered before giving the worker back to the pool
+
+    def __init__(self, pool, callback_method, size, overflow):
+        self._pool = pool
+        self._callback_method = callback_method
+        self._size = size
+        self._overflow = overflow
+        self._items = deque()       # [merge key, data] entries
+        self._latest = {}           # Merge key -> pending entry, used by KEEP_LATEST policy
+        self._scheduled = False
+        self._lock = Lock()
+        self._not_full = Condition(self._lock)
+        self._delivered = 0
+        self._dropped = 0
+        self._merged = 0
+        self._errors = 0
+
+    def _drop_oldest(self):
+        entry = self._items.popleft()
+        if self._latest.get(entry[0]) is entry:
+            del self._latest[entry[0]]
+        self._dropped += 1
+
+    def put(self, data, merge_key=None):
+        """
+        Adds a notification, applying the overflow policy if the queue is full
+        :param data: The data sent to the callback method
+        :param merge_key: If not None, a pending notification with the same key may be replaced (KEEP_LATEST policy)
+        """
+        with self._lock:
+            if merge_key is not None and self._overflow == WorkerPool.KEEP_LATEST:
+                entry = self._latest.get(merge_key)
+                if entry is not None:
+                    entry[1] = data
+                    self._merged += 1
+                    return
+            if self._pool.is_stopped():
+                return
+            if len(self._items) >= self._size:
+                if self._overflow == WorkerPool.BLOCK:
+                    while len(self._items) >= self._size and not self._pool.is_stopped():
+                        self._not_full.wait()
+                    if self._pool.is_stopped():
+                        return
+                else:
+                    self._drop_oldest()
+            entry = [merge_key, data]
+            self._items.append(entry)
+            if merge_key is not None and self._overflow == WorkerPool.KEEP_LATEST:
+                self._latest[merge_key] = entry
+            if not self._scheduled:
+                self._scheduled = True
+                self._pool.schedule(self)
+
+    def run(self):
+        """
+        Delivers pending notifications, called by a worker thread
+        """
+        metrics = self._pool.get_metrics()
+        for index in range(self._SLICE):
+            with self._lock:
+                if len(self._items) == 0 or self._pool.is_stopped():
+                    self._scheduled = False
+                    return
+                entry = self._items.popleft()
+                if self._latest.get(entry[0]) is entry:
+                    del self._latest[entry[0]]
+                self._not_full.notify()
+            try:
+                if metrics is None:
+                    self._callback_method(entry[1])
+                else:
+                    start = perf_counter()
+                    self._callback_method(entry[1])
+                    metrics.observe_callback(self._callback_method, perf_counter() - start)
+            except Exception:
+                import traceback
+                self._errors += 1
+                traceback.print_exc()
+            self._delivered += 1
+        # Slice is over, queue goes back to the end of the pool queue to let other subscribers run
+        self._pool.schedule(self)
+
+    def wake_up(self):
+        """
+        Wakes up a thread waiting for room in the queue, called when the pool is stopped
+        """
+        with self._lock:
+            self._not_full.notify_all()
+
+    def get_stats(self):
+        """
+        Gets queue counters
+        :return: A dictionary with queue depth and delivered, dropped, merged and failed notification counts
+        """
+        return {
+            'depth': len(self._items),
+            'delivered': self._delivered,
+            'dropped': self._dropped,
+            'merged': self._merged,
+            'errors': self._errors
+        }
+
+
+class QueuedSubscriber(Subscriber):
+    """
+    Class that defines a subscriber whose callback method runs on a worker pool
+    """
+
+    def __init__(self, pool, callback_method, program, event_type, object_id, overflow=None, records=False):
+        Subscriber.__init__(self, callback_method, program, event_type, object_id, records)
+        self._mergeable = pool.is_mergeable(event_type)
+        self._queue = pool.create_queue(callback_method, overflow)
+
+    def notify(self, event):
+        # The record is reused by the reader, the worker gets a copy
+        merge_key = (event.program, event.event_type, event.object_id) if self._mergeable else None
+        self._queue.put(event.copy() if self._records else event.to_list(), merge_key)
+
+    def measure_notify(self, event, metrics):
+        # The callback method runs later on a worker, which measures its duration
+        self.notify(event)
+
+    def get_stats(self):
+        return self._queue.get_stats()
+
+
+class WorkerPool:
+    """
+    Class that defines a pool of threads running subscriber callback methods, so that a slow subscriber does not
+    stop MIDI input. Each subscriber has its own bounded queue, with one of the following overflow policies:
+    - BLOCK: the reader waits until the subscriber has room for a new event
+    - DROP_OLDEST: the oldest pending event is dropped
+    - KEEP_LATEST: a pending event of the same control is replaced by the new one, other events are handled as with
+      DROP_OLDEST when the queue is full. Only event types given as mergeable are replaced, pad events never are
+    """
+
+    BLOCK = 0
+    DROP_OLDEST = 1
+    KEEP_LATEST = 2
+
+    def __init__(self, workers=4, queue_size=256, overflow=BLOCK, mergeable_types=()):
+        """
+        :param workers: Number of worker threads
+        :param queue_size: Maximum number of pending events per subscriber
+        :param overflow: Default overflow policy (BLOCK, DROP_OLDEST or KEEP_LATEST)
+        :param mergeable_types: Event types that KEEP_LATEST policy may replace
+        """
+        self._workers = workers
+        self._queue_size = queue_size
+        self._overflow = overflow
+        self._mergeable_types = set(mergeable_types)
+        self._ready = Queue()
+        self._threads = []
+        self._queues = WeakValueDictionary()    # Callback method -> queue, kept while a subscription uses it
+        self._lock = Lock()
+        self._metrics = None
+        self._stopped = False
+
+    def set_metrics(self, metrics):
+        """
+        Sets the Metrics object storing callback durations
+        :param metrics: The Metrics object, None to stop measuring
+        """
+        self._metrics = metrics
+
+    def get_metrics(self):
+        return self._metrics
+
+    def is_mergeable(self, event_type):
+        return event_type in self._mergeable_types
+
+    def create_queue(self, callback_method, overflow=None):
+        """
+        Gets the queue of a subscriber, built at its first subscription. All subscriptions of a callback method share
+        a queue, so that the callback method never runs on two workers at once and gets its events in order
+        :param callback_method: The subscriber callback method
+        :param overflow: Overflow policy, the pool default policy if None. Ignored if the queue already exists, it
+                         keeps the policy of its first subscription
+        :return: A SubscriberQueue object
+        """
+        if overflow is None:
+            overflow = self._overflow
+        with self._lock:
+            subscriber_queue = self._queues.get(callback_method)
+            if subscriber_queue is None:
+                subscriber_queue = SubscriberQueue(self, callback_method, self._queue_size, overflow)
+                self._queues[callback_method] = subscriber_queue
+        return subscriber_queue
+
+    def is_stopped(self):
+        return self._stopped
+
+    def schedule(self, subscriber_queue):
+        """
+        Hands a queue with pending events to a worker
+        :param subscriber_queue: The SubscriberQueue object
+        """
+        if self._stopped:
+            return
+        if len(self._threads) == 0:
+            self._start()
+        self._ready.put(subscriber_queue)
+
+    def _start(self):
+        with self._lock:
+            if len(self._threads) == 0 and not self._stopped:
+                for index in range(self._workers):
+                    thread = Thread(target=self._work, name='lpd8-worker-' + str(index), daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            subscriber_queue = self._ready.get()
+            if subscriber_queue is None:
+                break
+            subscriber_queue.run()
+
+    def stop(self):
+        """
+        Stops worker threads, events still pending are not delivered and new events are ignored. Threads waiting for
+        room in a subscriber queue are released
+        """
+        with self._lock:
+            self._stopped = True
+            for thread in self._threads:
+                self._ready.put(None)
+            self._threads = []
+            subscriber_queues = list(self._queues.values())
+        for subscriber_queue in subscriber_queues:
+            subscriber_queue.wake_up()
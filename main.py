@@ -4,7 +4,6 @@ from lpd8.pads import Pad, Pads
 from lpd8.knobs import Knobs
 from lpd8.pgm_chg import Pgm_Chg
 from consummer import Consummer
-from time import sleep
 
 # This object is created to test different callbacks from LPD8 class
 consummer = Consummer()
@@ -56,17 +55,10 @@ lpd8.subscribe(consummer.note_off_value, Programs.PGM_4, LPD8.NOTE_OFF, Pads.ALL
 lpd8.subscribe(consummer.pgm_change, Programs.PGM_4, LPD8.PGM_CHG, Pgm_Chg.PGM_CHG_4)
 lpd8.subscribe(consummer.pgm_change, Programs.PGM_4, LPD8.PGM_CHG, Pgm_Chg.PGM_CHG_4)
 
-# We loop as long as test class allows it
-while consummer.is_running():
-
-    # Every loop, we update pads status (blink, ON or OFF)
-    # This method returns True if LPD8 pad is still running, False otherwise
-    if lpd8.pad_update():
-        sleep(.5)
-    else:
-
-        # If LPD8 pad is not running anymore, we leave the loop
-        consummer.stop()
+# Pads status (blink, ON or OFF) is refreshed by the LED engine of the LPD8 object, so we only have to wait
+# as long as test class allows it (if LPD8 pad is not running, there is nothing to wait for)
+if lpd8.is_running():
+    consummer.wait()
 
 # We tidy up things and kill LPD8 process
 lpd8.stop()
\ No newline at end of file
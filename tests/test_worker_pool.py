@@ -0,0 +1,48 @@
+import unittest
+from threading import Lock, Event
+from time import sleep
+from lpd8.knobs import Knobs
+from lpd8.lpd8 import LPD8
+from lpd8.programs import Programs
+from lpd8.transport import LoopbackTransport
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def test_list_subscription_is_serialized_and_ordered(self):
+        transport = LoopbackTransport()
+        lpd8 = LPD8(transport=transport, workers=4, queue_size=1024)
+        lock = Lock()
+        running = [0]
+        overlaps = [0]
+        received = []
+        done = Event()
+        messages = [[176 + Programs.PGM_4 - 1, knob, value] for value in range(1, 31) for knob in Knobs.ALL_KNOBS]
+
+        def callback(data):
+            with lock:
+                running[0] += 1
+                if running[0] > 1:
+                    overlaps[0] += 1
+            sleep(0.0005)
+            with lock:
+                running[0] -= 1
+                received.append((data[1], data[2]))
+                if len(received) == len(messages):
+                    done.set()
+
+        lpd8.subscribe(callback, Programs.PGM_4, LPD8.CTRL, Knobs.ALL_KNOBS)
+        lpd8.start()
+        try:
+            for message in messages:
+                transport.inject(message)
+            self.assertTrue(done.wait(10))
+        finally:
+            lpd8.stop()
+            lpd8.join()
+        self.assertEqual(overlaps[0], 0)
+        self.assertEqual(received, [(message[1], message[2]) for message in messages])
+
+
+if __name__ == '__main__':
+    unittest.main()